@@ -1,53 +1,156 @@
+import os
+import sys
+import threading
+import joblib
+import logging
+from dotenv import dotenv_values
 from nltk.corpus import stopwords
 from nltk.stem.porter import PorterStemmer
 from nltk.tokenize import RegexpTokenizer
 from sklearn.feature_extraction.text import CountVectorizer
 from sklearn.naive_bayes import MultinomialNB
 
-tokenizer=RegexpTokenizer(r'\w+')  
-en_stopwords=set(stopwords.words('english'))  
+tokenizer=RegexpTokenizer(r'\w+')
+en_stopwords=set(stopwords.words('english'))
 ps=PorterStemmer()
 
-def getCleanedText(text):  
-    text = text.lower()  
-    #tokenize  
+credentials = dotenv_values(".env")
+
+logger = logging.getLogger("csnb.analytics")
+
+# Path of a trained (vectorizer, model) artifact, falls back to fitting the built-in corpus
+MODEL_PATH = credentials.get('SENTIMENT_MODEL', "sentiment.joblib")
+
+X_train = [
+        "CSNB.in provides best news for students",
+        "It is a great platform to start off your CyberSecurityTips image",
+        "Concepts are explained very well",
+        "The articles have some interesting stories",
+        "Some blogs are bad",
+        "Their content can confuse students",
+        "This Blog makes no sense",
+        "Your knowledge of this domain is greatly presented",
+        "Your tip did not work",
+        "That is a good tip but only for a small scope",
+        "It's a good approach, could be more affordable."
+    ]
+
+# 1 : Positive, 0 : Neutral , -1 : Negative
+y_train = [1,1,0,0,-1,-1,-1,1,-1,0,0]
+
+LABELS = {
+    1 : "positive",
+    0 : "neutral",
+    -1: "negative"
+}
+
+def getCleanedText(text):
+    text = text.lower()
+    #tokenize
     tokens=tokenizer.tokenize(text)
-    new_tokens=[token for token in tokens if token not in en_stopwords]  
-    stemmed_tokens=[ps.stem(tokens) for tokens in new_tokens]  
-    clean_text=" ".join(stemmed_tokens)  
-    return clean_text   
+    new_tokens=[token for token in tokens if token not in en_stopwords]
+    stemmed_tokens=[ps.stem(tokens) for tokens in new_tokens]
+    clean_text=" ".join(stemmed_tokens)
+    return clean_text
+
+def train(texts : list = X_train, labels : list = y_train):
+    cv=CountVectorizer(ngram_range=(1,2))
+    # MultinomialNB accepts the sparse CSR matrix directly, no need to densify it
+    X_vect = cv.fit_transform([getCleanedText(j) for j in texts])
+
+    mlb = MultinomialNB()
+    mlb.fit(X_vect,labels)
+    return {"vectorizer" : cv, "model" : mlb}
+
+def save(path : str = MODEL_PATH, texts : list = X_train, labels : list = y_train):
+    # Write to a temporary file first so a running server never loads a half written artifact
+    artifact = train(texts, labels)
+    joblib.dump(artifact, path + ".tmp")
+    os.replace(path + ".tmp", path)
+    return artifact
+
+
+class ModelRegistry:
+    """Keeps the fitted vectorizer and model in memory and reloads them when the artifact on disk changes."""
+
+    def __init__(self, path : str = MODEL_PATH):
+        self.path = path
+        self._artifact = None
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def _artifact_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def reload(self):
+        with self._lock:
+            mtime = self._artifact_mtime()
+            try:
+                artifact = joblib.load(self.path) if mtime is not None else train()
+                if not {"vectorizer", "model"} <= set(artifact):
+                    raise ValueError("not a vectorizer and model artifact")
+            except Exception:
+                # A bad artifact must not fail comment writes: keep the previous model (or the built-in one at startup),
+                # its mtime is recorded so it is only tried again once the file changes
+                logger.exception("Could not load the sentiment model %s, keeping the previous one", self.path)
+                artifact = self._artifact if self._artifact is not None else train()
+            self._artifact = artifact
+            self._mtime = mtime
+        return self._artifact
+
+    def get(self):
+        # A single stat() per call is enough to pick up a retrained artifact without a restart
+        if self._artifact is None or self._artifact_mtime() != self._mtime:
+            return self.reload()
+        return self._artifact
+
+registry = ModelRegistry()
 
 def analyze(X_test : list):
-    X_train = [
-            "CSNB.in provides best news for students",  
-            "It is a great platform to start off your CyberSecurityTips image",  
-            "Concepts are explained very well",  
-            "The articles have some interesting stories",  
-            "Some blogs are bad",  
-            "Their content can confuse students",
-            "This Blog makes no sense",
-            "Your knowledge of this domain is greatly presented",
-            "Your tip did not work",
-            "That is a good tip but only for a small scope",
-            "It's a good approach, could be more affordable."
-        ]
-
-    # 1 : Positive, 0 : Neutral , -1 : Negative
-    y_train = [1,1,0,0,-1,-1,-1,1,-1,0,0]
-    
-    X_clean = [getCleanedText(j) for j in X_train]
-    Xt_clean = [getCleanedText(j) for j in X_test]
+    if not X_test:
+        return []
+    artifact = registry.get()
+    Xt_vect = artifact["vectorizer"].transform([getCleanedText(j) for j in X_test])
+    y_pred = artifact["model"].predict(Xt_vect)
 
-    cv=CountVectorizer(ngram_range=(1,2))
+    return  [int(y) for y in y_pred]
 
-    X_vect = cv.fit_transform(X_clean).toarray()
-    Xt_vect = cv.transform(Xt_clean).toarray()
+# Score comments that have no stored sentiment yet (rows written before the column existed)
+def backfill(db, blogID : int = None, batch_size : int = 500):
+    from models import Comment
 
-    mlb = MultinomialNB()
-    mlb.fit(X_vect,y_train)
-    y_pred = mlb.predict(Xt_vect)
+    scored = 0
+    last_id = 0
+    while True:
+        qry = db.query(Comment.c_id, Comment.description).filter(Comment.sentiment == None, Comment.c_id > last_id)
+        if blogID is not None:
+            qry = qry.filter(Comment.blogID == blogID)
+        batch = qry.order_by(Comment.c_id).limit(batch_size).all()
+        if not batch:
+            break
+
+        labels = analyze([row.description or "" for row in batch])
+        db.bulk_update_mappings(Comment, [{"c_id" : row.c_id, "sentiment" : label} for row, label in zip(batch, labels)])
+        db.commit()
 
-    return  list(y_pred)
+        scored += len(batch)
+        last_id = batch[-1].c_id
+    return scored
 
 if __name__=="__main__":
-    analyze()
\ No newline at end of file
+    # python analytics.py backfill : upgrade an existing database and score every comment
+    # python analytics.py [path]  : train and write the model artifact
+    if len(sys.argv) > 1 and sys.argv[1] == "backfill":
+        from database import SessionLocal, engine
+        from migrations import migrate
+        migrate(engine)
+        db = SessionLocal()
+        try:
+            print(f"Scored {backfill(db)} comments.")
+        finally:
+            db.close()
+    else:
+        save(sys.argv[1] if len(sys.argv) > 1 else MODEL_PATH)
@@ -1,8 +1,9 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from passlib.context import CryptContext
 from fastapi import HTTPException
-import smtplib
 from sqlalchemy.orm import Session
-from typing import List
+from mailer import enqueue
 from models import User
 import jwt as jtoken
 from dotenv import dotenv_values
@@ -10,68 +11,80 @@ from dotenv import dotenv_values
 from http import HTTPStatus
 
 
-pwd_context = CryptContext(schemes=['bcrypt'], deprecated='auto')
+credentials = dotenv_values(".env")
+
+# Hashes below the configured cost are reported by pwd_context.needs_update and upgraded on login
+BCRYPT_ROUNDS = int(credentials.get('BCRYPT_ROUNDS', 12))
+pwd_context = CryptContext(schemes=['bcrypt'], deprecated='auto', bcrypt__default_rounds=BCRYPT_ROUNDS, bcrypt__min_rounds=BCRYPT_ROUNDS)
+
+# bcrypt is CPU bound and releases the GIL, so it runs on a small dedicated thread pool
+# instead of blocking the event loop for every login or sign-up.
+class HashingPool:
+    def __init__(self, workers : int, queue_limit : int):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.pending = 0
+        self.rejected = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+
+    async def run(self, fn, *args):
+        # pending is only touched from the event loop thread, no lock needed
+        if self.pending >= self.workers + self.queue_limit:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+                detail="Server busy, please try again.",
+                headers={"Retry-After":"1"}
+            )
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            self.pending -= 1
+
+    def stats(self):
+        return {
+            "workers" : self.workers,
+            "in_flight" : min(self.pending, self.workers),
+            "queued" : max(self.pending - self.workers, 0),
+            "queue_limit" : self.queue_limit,
+            "rejected" : self.rejected,
+        }
+
+hashing_pool = HashingPool(
+    workers=int(credentials.get('HASH_WORKERS', 4)),
+    queue_limit=int(credentials.get('HASH_QUEUE_LIMIT', 64)),
+)
 
 # Hash function to encrypt User: Password
-def hash_password(password):
-    return pwd_context.hash(password)
+async def hash_password(password):
+    return await hashing_pool.run(pwd_context.hash, password)
 
 #--------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
 
-credentials = dotenv_values(".env")
-
-# Verification mail to be sent on Sign-up   
-async def send_verification(email:List,user):
-    server = smtplib.SMTP_SSL(host='smtp-mail.outlook.com')
-    server.ehlo()
-    server.login(credentials['EMAIL'],  credentials['PASSWORD'])
+# Verification mail to be sent on Sign-up, queued in the outbox with the new user and delivered by mailer.mail_sender
+VERIFY_URL = credentials.get('VERIFY_URL', "http://localhost:8000/user/verify/")
 
+def queue_verification(db : Session, user : User):
     token = {
-        "username" : user['username'],
+        "username" : user.username,
     }
-    
     tokengen = jtoken.encode(token,credentials["SECRET"],algorithm=credentials['Algorithm'])
-
-    template = f"""
-    <html lang="en">
-    <body>
-        <div style="border-radius:1rem;background-color: rgb(122, 122, 122);margin: 5%;padding :5%;">
-            <div style="display: flex; align-items:center; justify-content: center; border: .1rem solid black ;border-radius:.5rem; padding:5%; background-color : white">
-                <blockquote>
-                    <h2 style="text-align:center; font-family: 'Franklin Gothic Medium';">Email Confirmation</h2>
-                </blockquote>
-                <figcaption>
-                    "Thanks For Choosing Filthrift, Please Click on the Below Button to verify your account."
-                </figcaption>
-                <div style="text-align:center; background-color: rgb(255, 255, 255); width:50% ;margin: auto; margin-top: 3rem; border:.1rem solid black; padding: .5rem;border-radius:1rem;">
-                    <a href="http://localhost:8000/user/verify/?token={tokengen}" style="text-decoration: none; color : black;">Verify your Email!</a>
-                </div>
-            </div>
-        </div>
-    </body>
-    </html>
-    """
-    full_email = ("From: {0} <{1}>\n"
-                  "To: {2} <{3}>\n"
-                  "Subject: {4}\n\n"
-                  "{5}"
-                  .format("CSNB.in", credentials['EMAIL'], user['username'], email, subject='CSNB Account Verification',message=template))
-
-    try:
-        await server.sendmail(credentials['EMAIL'], [email], full_email)
-        print('Email to {} successfully sent!\n\n'.format(email))
-    except Exception as e:
-        print('Email to {} could not be sent :( because {}\n\n'.format(email, str(e)))
-
-# Close the smtp server
-    server.close()
+    enqueue(db, user.email, "CSNB Account Verification", "verification_email.html", username=user.username, link=f"{VERIFY_URL}?token={tokengen}")
 # -------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
 
 credentials = dotenv_values(".env")
 
+# Username a bearer token was issued for, None when the token is invalid
+def token_subject(token : str):
+    try:
+        return jtoken.decode(token, credentials['SECRET'], algorithms=[credentials['Algorithm']]).get('username')
+    except Exception:
+        return None
+
 # Token Verification
 async def verify_user(passwordPlain,passwordEncrypted):
-    return pwd_context.verify(passwordPlain,passwordEncrypted)
+    return await hashing_pool.run(pwd_context.verify,passwordPlain,passwordEncrypted)
 
 def verify_token(token :str,db:Session):
 
@@ -93,9 +106,18 @@ def verify_token(token :str,db:Session):
 # User Authentication
 async def authenticate(username,password,db:Session):
     user = db.query(User).filter(User.username == username).first()
-    if user and await verify_user(password, user.password):
-        return user
-    return False
+    if not user:
+        return False
+
+    verified, new_hash = await hashing_pool.run(pwd_context.verify_and_update, password, user.password)
+    if not verified:
+        return False
+
+    # Transparently upgrade hashes made with outdated bcrypt cost parameters
+    if new_hash:
+        user.password = new_hash
+        db.commit()
+    return user
 
 
 # Token Generation
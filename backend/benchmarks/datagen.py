@@ -0,0 +1,154 @@
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import func, select
+import models
+from authentication import pwd_context
+from benchmarks.search import sentence
+from database import make_engine
+from ingest import dedup_key
+from migrations import migrate
+
+# python -m benchmarks.datagen [database url] [scale] [table=rows ...]
+# Fills an empty database with seeded synthetic users, admins, news, blogs, likes and comments through batched
+# executemany inserts, then runs the migrations once so the FTS index and comment counts are built in bulk.
+#   python -m benchmarks.datagen sqlite:///./bench.db large
+#   python -m benchmarks.datagen sqlite:///./bench.db small comments=200000
+# The same seed and scale always give the same rows, benchmarks.load relies on it to pick ids and log in.
+
+SCALES = {
+    "small" : {"users" : 1000, "news" : 10000, "blogs" : 2000, "comments" : 50000, "likes" : 20000},
+    "medium" : {"users" : 10000, "news" : 100000, "blogs" : 20000, "comments" : 500000, "likes" : 200000},
+    "large" : {"users" : 100000, "news" : 1000000, "blogs" : 200000, "comments" : 5000000, "likes" : 2000000},
+}
+SEED = 7
+BATCH = 10000
+PASSWORD = "bench-password" # every generated user shares it, hashed once
+AUTHOR_SHARE = 10 # one user in ten writes blogs
+START = datetime(2022, 1, 1)
+
+def parse_scale(args : list):
+    # "large", "comments=200000" ... on top of the small scale
+    scale = dict(SCALES["small"])
+    for arg in args:
+        if "=" in arg:
+            table, rows = arg.split("=", 1)
+            if table not in scale:
+                raise SystemExit(f"Unknown table {table!r}, expected one of {list(scale)}")
+            scale[table] = int(rows)
+        elif arg in SCALES:
+            scale.update(SCALES[arg])
+        else:
+            raise SystemExit(f"Unknown scale {arg!r}, expected one of {list(SCALES)}")
+    return scale
+
+def admin_count(users : int):
+    return max(users // 1000, 1)
+
+def author_count(users : int):
+    return max(users // AUTHOR_SHARE, 1)
+
+def author_of(b_id : int, users : int):
+    # Round robin over the first users, the blogs of author a are a, a + authors, a + 2 * authors ...
+    return (b_id - 1) % author_count(users) + 1
+
+def blogs_of(author : int, scale : dict):
+    return range(author, scale["blogs"] + 1, author_count(scale["users"]))
+
+def popular(rng, count : int):
+    # Power law over ids: the first blogs get most of the traffic, like a front page
+    return int(count * rng.random() ** 3) + 1
+
+def spread(index : int, total : int):
+    # Publication dates grow with the id, across two years
+    return START + timedelta(minutes=index * 2 * 365 * 24 * 60 // max(total, 1))
+
+def users(rng, scale : dict):
+    password = pwd_context.hash(PASSWORD)
+    admins = admin_count(scale["users"])
+    for i in range(1, scale["users"] + 1):
+        yield {"id" : i, "profilePicture" : "UserDefault.jpg", "fullname" : f"Bench User {i}", "username" : f"user{i}",
+               "description" : sentence(rng, 12), "email" : f"user{i}@bench.csnb.in", "gender" : rng.choice(["male", "female", "other", "rather not say"]),
+               "isAdmin" : i <= admins, "password" : password, "createdAt" : spread(i, scale["users"])}
+
+def admins(rng, scale : dict):
+    for i in range(1, admin_count(scale["users"]) + 1):
+        yield {"id" : i, "userID" : i, "createdAt" : START}
+
+def news(rng, scale : dict):
+    for i in range(1, scale["news"] + 1):
+        title = f"{sentence(rng, 8)} {i}"
+        yield {"n_id" : i, "author" : f"Reporter {rng.randrange(500)}", "title" : title, "description" : sentence(rng, 25),
+               "url" : f"https://news.example.com/{i}", "urlToImage" : None, "source" : f"source{rng.randrange(50)}",
+               "content" : sentence(rng, 60), "publishedAt" : spread(i, scale["news"]), "dedupKey" : dedup_key(title)}
+
+def blogs(rng, scale : dict, likes : dict):
+    admins = admin_count(scale["users"])
+    for i in range(1, scale["blogs"] + 1):
+        approved = rng.random() < 0.9
+        yield {"b_id" : i, "bannner" : "BlogDefault.png", "title" : sentence(rng, 8), "description" : sentence(rng, 150),
+               "authorID" : author_of(i, scale["users"]), "newsID" : rng.randint(1, scale["news"]) if scale["news"] else None,
+               "approverID" : rng.randint(1, admins) if approved else None, "approved" : approved,
+               "likes" : len(likes.get(i, ())), "commentCount" : 0, "publishedAt" : spread(i, scale["blogs"])}
+
+def pick_likes(rng, scale : dict):
+    # Distinct likers per blog, popular blogs collect most likes
+    likes = {}
+    for _ in range(scale["likes"]):
+        likes.setdefault(popular(rng, scale["blogs"]), set()).add(rng.randint(1, scale["users"]))
+    return likes
+
+def blog_likes(rng, scale : dict, likes : dict):
+    for b_id in sorted(likes):
+        for user in sorted(likes[b_id]):
+            yield {"blogID" : b_id, "userID" : user, "createdAt" : START}
+
+def comments(rng, scale : dict):
+    for i in range(1, scale["comments"] + 1):
+        yield {"c_id" : i, "description" : sentence(rng, 20), "userID" : rng.randint(1, scale["users"]),
+               "blogID" : popular(rng, scale["blogs"]), "publishedAt" : spread(i, scale["comments"]),
+               "likes" : 0, "sentiment" : rng.choice([1, 0, -1])}
+
+def insert(engine, model, rows):
+    table = model.__table__
+    count = 0
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == BATCH:
+                conn.execute(table.insert(), batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            conn.execute(table.insert(), batch)
+            count += len(batch)
+    took = time.perf_counter() - started
+    print(f"{table.name:>12} : {count} rows in {took:.1f}s ({count / took if took else 0:.0f} rows/s)")
+
+def generate(engine, scale : dict, seed : int = SEED):
+    models.Base.metadata.create_all(bind=engine)
+    with engine.connect() as conn:
+        if conn.execute(select(func.count()).select_from(models.User.__table__)).scalar():
+            raise SystemExit("The database already has users, generate into a new one.")
+    rng = random.Random(seed)
+    likes = pick_likes(rng, scale) if scale["blogs"] and scale["users"] else {}
+    insert(engine, models.User, users(rng, scale))
+    insert(engine, models.Admin, admins(rng, scale))
+    insert(engine, models.News, news(rng, scale))
+    insert(engine, models.Blog, blogs(rng, scale, likes))
+    insert(engine, models.BlogLike, blog_likes(rng, scale, likes))
+    if scale["blogs"]:
+        insert(engine, models.Comment, comments(rng, scale))
+    # Every migration runs on the filled tables: the FTS index is rebuilt and comment counts reconciled once
+    started = time.perf_counter()
+    migrate(engine)
+    print(f"{'migrations':>12} : {time.perf_counter() - started:.1f}s")
+
+if __name__ == "__main__":
+    url = sys.argv[1] if len(sys.argv) > 1 else "sqlite:///./bench.db"
+    scale = parse_scale(sys.argv[2:])
+    print(f"Generating {scale} into {url}")
+    generate(make_engine(url=url), scale)
@@ -0,0 +1,40 @@
+import os
+import resource
+import sys
+import tempfile
+import time
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+import models
+from database import SQLITE_PRAGMAS, sqlite_engine
+from export import export_rows
+
+# python -m benchmarks.export [comments] [format]
+# Exports a generated comments table through export_rows and reports throughput and peak RSS before / after,
+# the peak should not move with the table size.
+# mmap is off here: pages of the database file mapped by SQLite count towards RSS (up to SQLITE_MMAP_SIZE)
+# but are page cache, not memory held by the export.
+
+def peak_rss_mb():
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+def fill(engine, rows : int):
+    models.Base.metadata.create_all(bind=engine)
+    batch = 50000
+    with engine.begin() as conn:
+        for start in range(0, rows, batch):
+            conn.execute(text("INSERT INTO comments (description, \"userID\", \"blogID\", \"publishedAt\", likes, sentiment) VALUES (:d, 1, :b, '2024-01-01 00:00:00.000000', 0, 1)"),
+                         [{"d" : f"comment {start + i} about the latest breach", "b" : (start + i) % 1000} for i in range(min(batch, rows - start))])
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    format = sys.argv[2] if len(sys.argv) > 2 else "ndjson"
+    engine = sqlite_engine(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'export.db')}", pragmas={**SQLITE_PRAGMAS, "mmap_size" : 0})
+    fill(engine, rows)
+    before = peak_rss_mb()
+
+    for gzip in (False, True):
+        started = time.perf_counter()
+        size = sum(len(chunk) for chunk in export_rows("comments", format, gzip=gzip, sessions=sessionmaker(bind=engine)))
+        took = time.perf_counter() - started
+        print(f"{format} gzip={gzip} : {rows} rows in {took:.1f}s ({rows / took:.0f} rows/s), {size / 1e6:.1f} MB, peak RSS {before} MB -> {peak_rss_mb()} MB")
@@ -0,0 +1,156 @@
+import asyncio
+import json
+import math
+import random
+import subprocess
+import sys
+import time
+import httpx
+from benchmarks.datagen import PASSWORD, SEED, author_count, blogs_of, parse_scale, popular
+from benchmarks.search import sentence
+
+# python -m benchmarks.load [target] [seconds] [concurrency] [mix] [scale] [table=rows ...] > results.json
+# Virtual users log in as generated users, then loop over a weighted mix of API calls for `seconds`.
+# target is "app" (main.app in process, with its startup and shutdown events, the database configured in .env)
+# or the base URL of a running server, e.g. http://localhost:8000. The scale must be the one the database was
+# generated with (benchmarks.datagen), ids and credentials are derived from it.
+# Prints p50 / p95 / p99 latency, throughput and status codes per endpoint as JSON, to compare between commits.
+# Initial logins are setup and not measured, bcrypt sheds logins above HASH_WORKERS + HASH_QUEUE_LIMIT with 503s.
+
+MIXES = {
+    "browse" : {"token" : 2, "list_blogs" : 35, "get_blog" : 40, "like" : 8, "comment" : 5, "analytics" : 10},
+    "read" : {"list_blogs" : 45, "get_blog" : 50, "analytics" : 5},
+    "write" : {"token" : 5, "list_blogs" : 15, "get_blog" : 20, "like" : 30, "comment" : 25, "analytics" : 5},
+}
+
+class VirtualUser:
+    def __init__(self, client : httpx.AsyncClient, user : int, scale : dict, rng : random.Random):
+        self.client = client
+        self.user = user
+        self.scale = scale
+        self.rng = rng
+        self.headers = {}
+        self.next_page = None
+        self.own_blogs = blogs_of(user, scale)
+
+    async def token(self):
+        response = await self.client.post("/token", data={"username" : f"user{self.user}", "password" : PASSWORD})
+        if response.status_code == 200:
+            self.headers = {"Authorization" : f"Bearer {response.json()['access_token']}"}
+        return response
+
+    async def list_blogs(self):
+        # Half of the time the next page of the previous list, like a reader scrolling
+        params = {"size" : 20}
+        if self.next_page and self.rng.random() < 0.5:
+            params["cursor"] = self.next_page
+        response = await self.client.get("/blog/all", params=params, headers=self.headers)
+        self.next_page = response.json().get("next_page") if response.status_code == 200 else None
+        return response
+
+    async def get_blog(self):
+        return await self.client.get(f"/blog/{popular(self.rng, self.scale['blogs'])}", headers=self.headers)
+
+    async def like(self):
+        # Uniform rather than popular, repeated likes of the same blog answer 409
+        return await self.client.post(f"/blog/{self.rng.randint(1, self.scale['blogs'])}/like", headers=self.headers)
+
+    async def comment(self):
+        return await self.client.post(f"/blog/{popular(self.rng, self.scale['blogs'])}/comment/upload",
+                                      json={"description" : sentence(self.rng, 20)}, headers=self.headers)
+
+    async def analytics(self):
+        return await self.client.get(f"/blog/{self.rng.choice(self.own_blogs)}/comment/analytics", params={"size" : 20}, headers=self.headers)
+
+async def virtual_user(vu : VirtualUser, mix : dict, stop : float, samples : list):
+    names, weights = list(mix), list(mix.values())
+    while time.perf_counter() < stop:
+        name = vu.rng.choices(names, weights)[0]
+        started = time.perf_counter()
+        try:
+            status = str((await getattr(vu, name)()).status_code)
+        except Exception as e:
+            status = type(e).__name__
+        samples.append((name, time.perf_counter() - started, status))
+
+def percentile(latencies : list, p : float):
+    # Nearest rank on sorted latencies
+    return round(latencies[max(math.ceil(p / 100 * len(latencies)) - 1, 0)] * 1000, 2)
+
+def summarize(samples : list, seconds : float):
+    latencies = sorted(latency for _, latency, _ in samples)
+    statuses = {}
+    for _, _, status in samples:
+        statuses[status] = statuses.get(status, 0) + 1
+    return {
+        "requests" : len(samples),
+        "throughput_rps" : round(len(samples) / seconds, 1),
+        "p50_ms" : percentile(latencies, 50),
+        "p95_ms" : percentile(latencies, 95),
+        "p99_ms" : percentile(latencies, 99),
+        "max_ms" : round(latencies[-1] * 1000, 2),
+        "statuses" : dict(sorted(statuses.items())),
+    }
+
+def commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+async def run(client : httpx.AsyncClient, scale : dict, mix : str, seconds : float, concurrency : int):
+    # Logged in users are authors (see datagen.author_of), so they can open the analytics of their own blogs
+    users = min(author_count(scale["users"]), scale["blogs"])
+    rng = random.Random(SEED)
+    vus = [VirtualUser(client, rng.randint(1, users), scale, random.Random(SEED + i)) for i in range(concurrency)]
+
+    started = time.perf_counter()
+    logins = await asyncio.gather(*(vu.token() for vu in vus))
+    failed = [response.status_code for response in logins if response.status_code != 200]
+    if failed:
+        raise SystemExit(f"{len(failed)} of {concurrency} logins failed ({failed[:5]}), is the database generated with this scale?")
+    setup = time.perf_counter() - started
+
+    samples = []
+    started = time.perf_counter()
+    await asyncio.gather(*(virtual_user(vu, MIXES[mix], started + seconds, samples) for vu in vus))
+    took = time.perf_counter() - started
+
+    endpoints = {}
+    for sample in samples:
+        endpoints.setdefault(sample[0], []).append(sample)
+    return {
+        "commit" : commit(),
+        "mix" : mix,
+        "concurrency" : concurrency,
+        "scale" : scale,
+        "setup_s" : round(setup, 2),
+        "seconds" : round(took, 2),
+        "endpoints" : {name : summarize(endpoints[name], took) for name in sorted(endpoints)},
+        "total" : summarize(samples, took) if samples else None,
+    }
+
+async def main(target : str, seconds : float, concurrency : int, mix : str, scale : dict):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    if target != "app":
+        async with httpx.AsyncClient(base_url=target, limits=limits, timeout=60) as client:
+            return await run(client, scale, mix, seconds, concurrency)
+
+    from main import app
+    await app.router.startup()
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://app", limits=limits, timeout=60) as client:
+            return await run(client, scale, mix, seconds, concurrency)
+    finally:
+        await app.router.shutdown()
+
+if __name__ == "__main__":
+    target = sys.argv[1] if len(sys.argv) > 1 else "app"
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 30
+    concurrency = int(sys.argv[3]) if len(sys.argv) > 3 else 32
+    mix = sys.argv[4] if len(sys.argv) > 4 else "browse"
+    if mix not in MIXES:
+        raise SystemExit(f"Unknown mix {mix!r}, expected one of {list(MIXES)}")
+    result = asyncio.run(main(target, seconds, concurrency, mix, parse_scale(sys.argv[5:])))
+    result["target"] = target
+    print(json.dumps(result, indent=2))
@@ -0,0 +1,51 @@
+import random
+import sys
+import time
+from better_profanity import profanity as reference
+from better_profanity.utils import get_complete_path_of_file, read_wordlist
+from profanity_filter import CHARS_MAPPING, profanity
+
+# python -m benchmarks.profanity [texts] [words per text]
+# Compares profanity_filter against better_profanity on generated blog bodies and checks the output is identical.
+
+FILLER = ("the news about this exploit is interesting, students should patch their servers before "
+          "attackers scan the network! CSNB.in explains: firewalls, phishing & ransomware... ").split(" ")
+
+def leet(word : str, rng : random.Random):
+    return "".join(rng.choice(CHARS_MAPPING[c]) if c in CHARS_MAPPING and rng.random() < 0.3 else c for c in word)
+
+def generate(count : int, words : int, seed : int = 7):
+    rng = random.Random(seed)
+    swears = list(read_wordlist(get_complete_path_of_file("profanity_wordlist.txt")))
+    texts = []
+    for _ in range(count):
+        tokens = []
+        for _ in range(words):
+            if rng.random() < 0.05:
+                swear = leet(rng.choice(swears), rng)
+                tokens.append(swear.upper() if rng.random() < 0.2 else swear)
+            else:
+                tokens.append(rng.choice(FILLER))
+        texts.append(rng.choice(["", " ", "\n", "-- "]) + " ".join(tokens) + rng.choice(["", ".", "!!", " "]))
+    return texts
+
+def timed(fn, texts):
+    started = time.perf_counter()
+    result = [fn(text) for text in texts]
+    return result, time.perf_counter() - started
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    words = int(sys.argv[2]) if len(sys.argv) > 2 else 400
+    texts = generate(count, words)
+    reference.load_censor_words()
+
+    expected, reference_time = timed(reference.censor, texts)
+    actual, compiled_time = timed(profanity.censor, texts)
+
+    mismatches = [i for i, (a, b) in enumerate(zip(expected, actual)) if a != b]
+    print(f"{count} texts x {words} words")
+    print(f"better_profanity : {reference_time:.3f}s")
+    print(f"profanity_filter : {compiled_time:.3f}s ({reference_time / compiled_time:.1f}x)")
+    print(f"identical output : {not mismatches}" + (f" (first mismatch at text {mismatches[0]})" if mismatches else ""))
+    sys.exit(1 if mismatches else 0)
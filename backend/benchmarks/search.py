@@ -0,0 +1,67 @@
+import itertools
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+import models
+from database import sqlite_engine
+from fastapi_pagination.api import set_page
+from migrations import migrate
+from pagination import KeysetPage, KeysetParams
+from search import SOURCES, search
+
+# python -m benchmarks.search [news rows]
+# Fills a scratch database with generated news, then times /search queries against the FTS5 index
+# and an unranked LIKE scan. FTS5 ranks every match, so its cost grows with how common the terms are.
+
+# Zipf distributed vocabulary like natural text: a few words are everywhere, most are rare
+TOPICS = ["breach", "ransomware", "phishing", "patch", "exploit", "botnet", "malware", "firewall", "vulnerability", "credential"]
+VOCABULARY = [f"term{i}" for i in range(200)] + TOPICS + [f"term{i}" for i in range(200, 20000)]
+WEIGHTS = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(VOCABULARY))))
+RARE = ["kerberoasting", "typosquatting", "sinkhole", "bootkit", "cryptojacking"]
+
+def sentence(rng, length : int):
+    words = rng.choices(VOCABULARY, cum_weights=WEIGHTS, k=length)
+    if rng.random() < 0.001:
+        words[rng.randrange(length)] = rng.choice(RARE)
+    return " ".join(words)
+
+def fill(engine, rows : int, seed : int = 7):
+    rng = random.Random(seed)
+    models.Base.metadata.create_all(bind=engine)
+    migrate(engine)
+    batch = 10000
+    with engine.begin() as conn:
+        for start in range(0, rows, batch):
+            conn.execute(text("INSERT INTO news (title, description, content, source, url) VALUES (:t, :d, :c, 's', 'u')"),
+                         [{"t" : sentence(rng, 8), "d" : sentence(rng, 25), "c" : sentence(rng, 60)} for _ in range(min(batch, rows - start))])
+
+def timed(run, repeat : int = 20):
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        latencies.append(time.perf_counter() - started)
+    return round(statistics.median(latencies) * 1000, 2)
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    engine = sqlite_engine(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'search.db')}")
+    started = time.perf_counter()
+    fill(engine, rows)
+    print(f"{rows} news rows indexed in {time.perf_counter() - started:.1f}s")
+
+    db = sessionmaker(bind=engine)()
+    set_page(KeysetPage)
+    params = KeysetParams(cursor=None, size=20, total="none")
+    for label, q in (("rare term", "kerberoasting"), ("rare prefix", "typosq*"), ("topic term", "ransomware"), ("two topic terms", "ransomware botnet")):
+        page = search(db, q, list(SOURCES), params)
+        fts_ms = timed(lambda : search(db, q, list(SOURCES), params))
+        word = q.split()[0].rstrip("*")
+        like_ms = timed(lambda : db.execute(text("SELECT n_id FROM news WHERE title LIKE :w OR description LIKE :w OR content LIKE :w LIMIT 21"), {"w" : f"%{word}%"}).fetchall(), repeat=3)
+        print(f"{label:>18} {q!r:>22} : fts5 {fts_ms} ms ({len(page.items)} hits), unranked LIKE scan to the first page {like_ms} ms")
+    db.close()
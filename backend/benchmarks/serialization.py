@@ -0,0 +1,75 @@
+import os
+import statistics
+import sys
+import tempfile
+import time
+from typing import List
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi_pagination.api import set_page
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+import models
+import schemas
+from database import sqlite_engine
+from loaders import blog_summaries, query_for
+from pagination import KeysetPage, KeysetParams, paginate
+
+# python -m benchmarks.serialization [page size] [comments per blog]
+# Time to build one /blog/all page the way the route does, for the previous full page (FullBlog, every comment embedded) and the BlogSummary page:
+#   page : query and response model validation (paginate) in a fresh session like a request, encode : jsonable_encoder, render : the response body
+
+# The /blog/all item before summaries and paged comments: the full blog with news, author and every comment
+class FullBlog(schemas.Blog):
+    comments : List[schemas.Comment]
+
+def seed(engine, blogs : int, comments : int):
+    models.Base.metadata.create_all(bind=engine)
+    body = "Threat actors exploited the flaw within hours of disclosure. " * 40
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO users (id, fullname, username, description, email, gender, \"profilePicture\", \"createdAt\") VALUES (1, 'Author', 'author', 'd', 'e', 'other', 'UserDefault.jpg', '2024-01-01 00:00:00.000000')"))
+        conn.execute(text("INSERT INTO news (n_id, title, description, content, source, url, \"publishedAt\") VALUES (:i, :t, :d, :c, 's', 'u', '2024-01-01 00:00:00.000000')"),
+                     [{"i" : i, "t" : f"headline {i}", "d" : body[:300], "c" : body} for i in range(1, blogs + 1)])
+        conn.execute(text("INSERT INTO blogs (b_id, title, description, \"authorID\", \"newsID\", approved, likes, \"commentCount\", \"publishedAt\") VALUES (:i, :t, :d, 1, :i, 1, 0, :c, '2024-01-01 00:00:00.000000')"),
+                     [{"i" : i, "t" : f"blog {i}", "d" : body, "c" : comments} for i in range(1, blogs + 1)])
+        conn.execute(text("INSERT INTO comments (description, \"userID\", \"blogID\", \"publishedAt\", likes) VALUES (:d, 1, :b, '2024-01-01 00:00:00.000000', 0)"),
+                     [{"d" : "Patch now, this one is bad.", "b" : b} for b in range(1, blogs + 1) for _ in range(comments)])
+
+def measure(build, repeat : int = 20):
+    timings = {"page" : [], "encode" : [], "render" : []}
+    for _ in range(repeat):
+        started = time.perf_counter()
+        page = build["page"]()
+        built = time.perf_counter()
+        content = jsonable_encoder(page)
+        encoded = time.perf_counter()
+        body = build["response"](content).body
+        rendered = time.perf_counter()
+        for name, took in (("page", built - started), ("encode", encoded - built), ("render", rendered - encoded)):
+            timings[name].append(took)
+    result = {f"{name}_ms" : round(statistics.median(values) * 1000, 2) for name, values in timings.items()}
+    result["total_ms"] = round(sum(result.values()), 2)
+    result["bytes"] = len(body)
+    return result
+
+if __name__ == "__main__":
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    comments = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    engine = sqlite_engine(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'serialization.db')}")
+    seed(engine, size, comments)
+    Session = sessionmaker(bind=engine)
+    params = KeysetParams(cursor=None, size=size, total="none")
+
+    set_page(KeysetPage[FullBlog])
+    full = {
+        "page" : lambda : paginate(query_for(Session(), models.Blog, FullBlog).filter(models.Blog.approved == True), models.Blog.b_id, params),
+        "response" : JSONResponse,
+    }
+    print(f"{'FullBlog + json':>28} : {measure(full)}")
+
+    set_page(KeysetPage[schemas.BlogSummary])
+    summary = {
+        "page" : lambda : paginate(blog_summaries(Session()).filter(models.Blog.approved == True), models.Blog.b_id, params),
+        "response" : ORJSONResponse,
+    }
+    print(f"{'schemas.BlogSummary + orjson':>28} : {measure(summary)}")
@@ -0,0 +1,73 @@
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from sqlalchemy import text
+from database import SQLITE_PRAGMAS, sqlite_engine
+
+# python -m benchmarks.wal [seconds] [readers]
+# Readers run indexed point reads while a writer keeps committing batches of comments.
+# With the default rollback journal every commit locks readers out, under the WAL profile they are never blocked.
+
+SCHEMA = [
+    "CREATE TABLE comments (c_id INTEGER PRIMARY KEY, description VARCHAR, \"blogID\" INTEGER)",
+    "CREATE INDEX ix_comments_blogID_c_id ON comments (\"blogID\", c_id)",
+]
+
+def run(pragmas : dict, seconds : float, readers : int):
+    directory = tempfile.mkdtemp()
+    engine = sqlite_engine(f"sqlite:///{os.path.join(directory, 'load.db')}", pragmas=pragmas)
+    with engine.begin() as conn:
+        for statement in SCHEMA:
+            conn.execute(text(statement))
+        conn.execute(text("INSERT INTO comments (description, \"blogID\") VALUES (:d, :b)"), [{"d" : "seed " * 20, "b" : i % 100} for i in range(20000)])
+
+    stop = time.monotonic() + seconds
+    latencies, errors, writes = [], [0], [0]
+    lock = threading.Lock()
+
+    def writer():
+        while time.monotonic() < stop:
+            with engine.begin() as conn:
+                conn.execute(text("INSERT INTO comments (description, \"blogID\") VALUES (:d, :b)"), [{"d" : "load " * 20, "b" : i % 100} for i in range(500)])
+            writes[0] += 1
+
+    def reader():
+        local = []
+        while time.monotonic() < stop:
+            started = time.perf_counter()
+            try:
+                with engine.connect() as conn:
+                    conn.execute(text("SELECT COUNT(*) FROM comments WHERE \"blogID\" = 7")).scalar()
+                local.append(time.perf_counter() - started)
+            except Exception:
+                with lock:
+                    errors[0] += 1
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=writer)] + [threading.Thread(target=reader) for _ in range(readers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    engine.dispose()
+
+    latencies.sort()
+    return {
+        "reads" : len(latencies),
+        "p50_ms" : round(statistics.median(latencies) * 1000, 2) if latencies else None,
+        "p99_ms" : round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 2) if latencies else None,
+        "max_ms" : round(latencies[-1] * 1000, 2) if latencies else None,
+        "read_errors" : errors[0],
+        "write_batches" : writes[0],
+    }
+
+if __name__ == "__main__":
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+    readers = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    baseline = {"journal_mode" : "DELETE", "synchronous" : "FULL", "busy_timeout" : SQLITE_PRAGMAS["busy_timeout"]}
+    for name, pragmas in (("rollback journal (previous default)", baseline), ("sqlite profile (WAL)", SQLITE_PRAGMAS)):
+        print(f"{name:>36} : {run(pragmas, seconds, readers)}")
@@ -0,0 +1,164 @@
+import functools
+import hashlib
+import inspect
+import threading
+import time
+from collections import OrderedDict
+from dotenv import dotenv_values
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import ORJSONResponse
+from pydantic import parse_obj_as
+
+credentials = dotenv_values(".env")
+
+# Seconds a cached page is served before it is rebuilt, writes invalidate earlier through tags
+NEWS_TTL = float(credentials.get('CACHE_NEWS_TTL', 60))
+BLOG_TTL = float(credentials.get('CACHE_BLOG_TTL', 30))
+
+# Response cache for hot read routes.
+# Entries are keyed by route + query and by the current version of every tag they depend on,
+# invalidating a tag bumps its version so every entry built from the old data is never served again.
+
+class MemoryBackend:
+    """In-process LRU bounded by total payload bytes, entries expire after their TTL."""
+
+    def __init__(self, max_bytes : int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def get(self, key : str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key : str, value : bytes, ttl : float):
+        with self._lock:
+            self._remove(key)
+            if len(value) > self.max_bytes:
+                return
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self.size += len(value)
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key : str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[1])
+
+    def get_counters(self, keys : list):
+        with self._lock:
+            return [self._counters.get(key, 0) for key in keys]
+
+    def incr(self, key : str):
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._counters.clear()
+            self.size = 0
+
+
+class RedisBackend:
+    """Shared cache on a Redis compatible server, any client exposing get/set/mget/incr works (e.g. fakeredis in tests)."""
+
+    def __init__(self, client, prefix : str = "csnb:"):
+        self.client = client
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url : str):
+        import redis
+        return cls(redis.Redis.from_url(url))
+
+    def get(self, key : str):
+        return self.client.get(self.prefix + key)
+
+    def set(self, key : str, value : bytes, ttl : float):
+        self.client.set(self.prefix + key, value, px=int(ttl * 1000))
+
+    def get_counters(self, keys : list):
+        return [int(value or 0) for value in self.client.mget([self.prefix + key for key in keys])]
+
+    def incr(self, key : str):
+        self.client.incr(self.prefix + key)
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + "*"):
+            self.client.delete(key)
+
+
+class ResponseCache:
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    def invalidate(self, *tags : str):
+        for tag in tags:
+            self.backend.incr("tag:" + tag)
+
+    def _key(self, route : str, request : Request, tags : list):
+        versions = self.backend.get_counters(["tag:" + tag for tag in tags])
+        query = "&".join(f"{k}={v}" for k, v in sorted(request.query_params.multi_items()))
+        raw = f"{route}|{request.url.path}|{query}|" + ",".join(f"{tag}={version}" for tag, version in zip(tags, versions))
+        return "page:" + hashlib.sha1(raw.encode()).hexdigest()
+
+    def cached(self, ttl : float, tags, model=None):
+        """
+        Cache the JSON body of a route for ttl seconds.
+
+        tags : list of tags, or a callable receiving the route's keyword arguments (e.g. lambda b_id, **_ : [f"blog:{b_id}"])
+        model : the route's response_model, hits bypass FastAPI's serialization so the body is validated here
+        """
+        def decorator(endpoint):
+            signature = inspect.signature(endpoint)
+            needs_request = "request" not in signature.parameters
+
+            @functools.wraps(endpoint)
+            async def wrapper(*args, **kwargs):
+                request = kwargs.pop("request") if needs_request else kwargs["request"]
+                route_tags = tags(**kwargs) if callable(tags) else list(tags)
+                key = self._key(endpoint.__name__, request, route_tags)
+
+                body = self.backend.get(key)
+                if body is not None:
+                    self.hits += 1
+                    return Response(content=body, media_type="application/json", headers={"X-Cache" : "HIT"})
+
+                self.misses += 1
+                result = await endpoint(*args, **kwargs)
+                if isinstance(result, Response):
+                    return result
+                content = jsonable_encoder(parse_obj_as(model, result) if model is not None else result)
+                response = ORJSONResponse(content=content, headers={"X-Cache" : "MISS"})
+                self.backend.set(key, response.body, ttl)
+                return response
+
+            if needs_request:
+                parameters = list(signature.parameters.values())
+                parameters.append(inspect.Parameter("request", inspect.Parameter.KEYWORD_ONLY, annotation=Request))
+                wrapper.__signature__ = signature.replace(parameters=parameters)
+            return wrapper
+        return decorator
+
+def make_backend():
+    url = credentials.get('CACHE_URL')
+    if url:
+        return RedisBackend.from_url(url)
+    return MemoryBackend(max_bytes=int(credentials.get('CACHE_MAX_BYTES', 64 * 1024 * 1024)))
+
+response_cache = ResponseCache(make_backend())
@@ -0,0 +1,28 @@
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from models import Blog
+
+# Denormalized blogs.commentCount, so blog lists show counts without touching the comments table.
+# comment_upload / comment_remove adjust it in the same transaction as the comment,
+# reconcile_comment_counts repairs rows that drifted (comments written by other tools, restores, ...).
+
+def adjust_comment_count(db : Session, b_id : int, delta : int):
+    # Atomic in SQL, concurrent comments never overwrite each other's increment
+    db.query(Blog).filter(Blog.b_id==b_id).update({Blog.commentCount : Blog.commentCount + delta}, synchronize_session=False)
+
+def reconcile_comment_counts(db):
+    # db : a Session or a Connection, only rows whose count is wrong are written
+    actual = 'SELECT COUNT(*) FROM comments WHERE comments."blogID" = blogs.b_id'
+    result = db.execute(text(f'UPDATE blogs SET "commentCount" = ({actual}) WHERE "commentCount" IS NULL OR "commentCount" <> ({actual})'))
+    return result.rowcount
+
+if __name__ == "__main__":
+    # python counts.py : recount comments of every blog, e.g. from a nightly cron
+    from database import SessionLocal
+    db = SessionLocal()
+    try:
+        fixed = reconcile_comment_counts(db)
+        db.commit()
+        print(f"Fixed the comment count of {fixed} blogs.")
+    finally:
+        db.close()
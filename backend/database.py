@@ -1,21 +1,112 @@
-from sqlalchemy import create_engine
+import itertools
+import threading
+from sqlalchemy import create_engine, event, insert, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
 from dotenv import dotenv_values
 
 credentials = dotenv_values(".env")
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./CSNB.db" # for sqlite (recommended to only use during developement)
-# SQLALCHEMY_DATABASE_URL = f'mssql://LAPTOP-T4E6IV9G/CSNB?trusted_connection=yes&driver=SQL Server Native Client 11.0' # for mssql (recommended to only use for deployment)
+# DB_PROFILE picks the engine tuning, DATABASE_URL the database:
+#   sqlite : WAL journal and connection pragmas so readers never wait on the writer (developement / single host)
+#   server : pooled connections to a database server, e.g. the MSSQL deployment
+#            DATABASE_URL=mssql://LAPTOP-T4E6IV9G/CSNB?trusted_connection=yes&driver=SQL Server Native Client 11.0
+DB_PROFILE = credentials.get('DB_PROFILE', "sqlite")
+SQLALCHEMY_DATABASE_URL = credentials.get('DATABASE_URL', "sqlite:///./CSNB.db")
+# Comma separated replica URLs that GET routes read from, same DB_PROFILE as the primary
+READ_URLS = [url.strip() for url in credentials.get('DATABASE_READ_URLS', "").split(",") if url.strip()]
 
+SQLITE_PRAGMAS = {
+    "journal_mode" : "WAL",
+    "synchronous" : "NORMAL",
+    "mmap_size" : int(credentials.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+    "cache_size" : int(credentials.get('SQLITE_CACHE_SIZE', -64000)), # negative : KiB, i.e. 64 MB per connection
+    "busy_timeout" : int(credentials.get('SQLITE_BUSY_TIMEOUT', 5000)), # ms a writer waits for the lock instead of failing
+    "temp_store" : "MEMORY",
+}
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL,
-    connect_args={"check_same_thread": False}
-)
-# connect_args={"check_same_thread": False}
-# ...is needed only for SQLite. It's not needed for other databases
+def sqlite_engine(url : str, pragmas : dict = SQLITE_PRAGMAS, **kwargs):
+    # check_same_thread=False is needed because FastAPI hands sessions across threads
+    engine = create_engine(
+        url,
+        connect_args={"check_same_thread": False, "timeout": pragmas.get("busy_timeout", 5000) / 1000},
+        poolclass=QueuePool,
+        pool_size=int(credentials.get('DB_POOL_SIZE', 10)),
+        max_overflow=int(credentials.get('DB_MAX_OVERFLOW', 20)),
+        **kwargs,
+    )
+
+    # Pragmas are per connection, pooling means they run once per connection instead of once per session
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    return engine
+
+def server_engine(url : str, **kwargs):
+    return create_engine(
+        url,
+        poolclass=QueuePool,
+        pool_size=int(credentials.get('DB_POOL_SIZE', 10)),
+        max_overflow=int(credentials.get('DB_MAX_OVERFLOW', 20)),
+        pool_timeout=float(credentials.get('DB_POOL_TIMEOUT', 30)),
+        pool_recycle=int(credentials.get('DB_POOL_RECYCLE', 1800)), # below typical server idle timeouts
+        pool_pre_ping=True, # drop connections the server closed instead of failing the request
+        **kwargs,
+    )
+
+PROFILES = {
+    "sqlite" : sqlite_engine,
+    "server" : server_engine,
+}
+
+def make_engine(profile : str = DB_PROFILE, url : str = SQLALCHEMY_DATABASE_URL, **kwargs):
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown DB_PROFILE {profile!r}, expected one of {list(PROFILES)}")
+    return PROFILES[profile](url, **kwargs)
+
+engine = make_engine()
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+def make_read_engines():
+    if READ_URLS:
+        return [make_engine(url=url) for url in READ_URLS]
+    if DB_PROFILE == "sqlite":
+        # Without replicas, a separate read-only pool on the same file, WAL lets it read while the primary writes
+        return [sqlite_engine(SQLALCHEMY_DATABASE_URL, pragmas={**SQLITE_PRAGMAS, "query_only" : "ON"})]
+    return [engine]
+
+read_engines = make_read_engines()
+_read_sessions = itertools.cycle([sessionmaker(autocommit=False, autoflush=False, bind=read_engine) for read_engine in read_engines])
+_read_lock = threading.Lock()
+
+# Round robin over the read engines
+def ReadSessionLocal():
+    with _read_lock:
+        return next(_read_sessions)()
+
 Base = declarative_base()
+
+
+# create_all never alters tables that already exist, columns added to the models later are added here (see migrations.py)
+def add_missing_columns(conn, table : str, columns : dict):
+    existing = [column["name"] for column in inspect(conn).get_columns(table)]
+    for name, ddl in columns.items():
+        if name not in existing:
+            conn.execute(text(f'ALTER TABLE {table} ADD COLUMN "{name}" {ddl}'))
+
+# INSERT that silently skips rows conflicting with a unique index, where the dialect supports it
+def insert_ignore(db, model, index_elements : list):
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        return insert(model)
+    return dialect_insert(model).on_conflict_do_nothing(index_elements=index_elements)
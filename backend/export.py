@@ -0,0 +1,66 @@
+import csv
+import io
+import zlib
+from datetime import datetime
+import orjson
+from dotenv import dotenv_values
+from sqlalchemy import inspect, select
+import models
+from database import ReadSessionLocal
+
+credentials = dotenv_values(".env")
+
+# Streaming bulk export for admins: rows are read in EXPORT_BATCH sized batches from a streaming cursor
+# and written out as they arrive, so memory stays constant whatever the table size.
+EXPORT_BATCH = int(credentials.get('EXPORT_BATCH', 1000))
+
+TABLES = {
+    "news" : models.News,
+    "blogs" : models.Blog,
+    "comments" : models.Comment,
+}
+FORMATS = {
+    "ndjson" : "application/x-ndjson",
+    "csv" : "text/csv",
+}
+
+def _columns(model):
+    # Attribute names, not column names (Blog.banner is stored as "bannner")
+    return [getattr(model, attr.key).label(attr.key) for attr in inspect(model).column_attrs]
+
+def _ndjson(rows, names):
+    return b"".join(orjson.dumps(dict(zip(names, row))) + b"\n" for row in rows)
+
+def _csv(rows, names):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows([value.isoformat() if isinstance(value, datetime) else value for value in row] for row in rows)
+    return buffer.getvalue().encode()
+
+def export_rows(table : str, format : str, since : datetime | None = None, gzip : bool = False, sessions=ReadSessionLocal):
+    """Generator of response chunks, one per batch. It owns its session, the request's is closed before streaming ends."""
+    model = TABLES[table]
+    columns = _columns(model)
+    names = [column.name for column in columns]
+    encode = _ndjson if format == "ndjson" else _csv
+    # wbits=31 : gzip framing, flushed per batch so the client receives data as it is read
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip else None
+
+    query = select(*columns).order_by(inspect(model).primary_key[0])
+    if since is not None:
+        query = query.filter(model.publishedAt >= since)
+
+    def emit(chunk : bytes):
+        return compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH) if compressor else chunk
+
+    db = sessions()
+    try:
+        if format == "csv":
+            yield emit(",".join(names).encode() + b"\r\n")
+        result = db.execute(query.execution_options(stream_results=True, yield_per=EXPORT_BATCH))
+        for rows in result.partitions():
+            yield emit(encode(rows, names))
+        if compressor:
+            yield compressor.flush()
+    finally:
+        db.close()
@@ -0,0 +1,240 @@
+import asyncio
+import hashlib
+import os
+import re
+import secrets
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from http import HTTPStatus
+from dotenv import dotenv_values
+from fastapi import HTTPException, UploadFile
+from PIL import Image, ImageOps
+from sqlalchemy.orm import Session
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from models import StoredImage
+
+credentials = dotenv_values(".env")
+
+STATIC_DIR = credentials.get('STATIC_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), "static"))
+MAX_UPLOAD_BYTES = int(credentials.get('MAX_UPLOAD_BYTES', 10 * 1024 * 1024))
+IMAGE_FORMAT = credentials.get('IMAGE_FORMAT', "webp").lower()
+CHUNK_SIZE = 64 * 1024
+
+# Pre-sized derivatives written for every upload, the stored filename is the "full" one
+DERIVATIVES = {
+    "thumb" : (96, 96),
+    "card" : (470, 960),
+    "full" : (1920, 1920),
+}
+
+EXTENSIONS = {"webp" : "webp", "jpeg" : "jpg"}
+
+# Stored images are named after the sha256 of the uploaded bytes, identical uploads share one set of files
+DIGEST_LENGTH = 32
+CONTENT_ADDRESSED = re.compile(rf"^(?P<digest>[0-9a-f]{{{DIGEST_LENGTH}}})_(?:{'|'.join(DERIVATIVES)})\.(?:{'|'.join(EXTENSIONS.values())})$")
+
+# Decoding and resizing is CPU bound, it runs in worker processes instead of on the event loop
+_pool = None
+
+def pool():
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=int(credentials.get('IMAGE_WORKERS', 2)))
+    return _pool
+
+def shutdown():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+def sniff_format(head : bytes):
+    # Trust the magic bytes, not the client supplied file name or content type
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+async def save_upload(file : UploadFile, directory : str):
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f".upload-{secrets.token_hex(8)}")
+    size = 0
+    digest = hashlib.sha256()
+    try:
+        with open(path, "wb") as out:
+            while chunk := await file.read(CHUNK_SIZE):
+                if size == 0 and sniff_format(chunk[:16]) is None:
+                    raise HTTPException(
+                        status_code=HTTPStatus.NOT_ACCEPTABLE,
+                        detail="Please Upload a png, jpg or webp.",
+                    )
+                size += len(chunk)
+                if size > MAX_UPLOAD_BYTES:
+                    raise HTTPException(
+                        status_code=HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                        detail=f"Images are limited to {MAX_UPLOAD_BYTES // (1024 * 1024)} MB.",
+                    )
+                digest.update(chunk)
+                out.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    finally:
+        await file.close()
+
+    if size == 0:
+        os.remove(path)
+        raise HTTPException(
+            status_code=HTTPStatus.NOT_ACCEPTABLE,
+            detail="Please Upload a png, jpg or webp.",
+        )
+    return path, digest.hexdigest()[:DIGEST_LENGTH]
+
+def derivative_name(stem : str, name : str, fmt : str = IMAGE_FORMAT):
+    return f"{stem}_{name}.{EXTENSIONS[fmt]}"
+
+# Runs in a worker process
+def make_derivatives(source : str, directory : str, stem : str, fmt : str = IMAGE_FORMAT):
+    with Image.open(source) as img:
+        img = ImageOps.exif_transpose(img)
+        img = img.convert("RGBA" if fmt == "webp" and img.mode in ("RGBA", "LA", "P") else "RGB")
+        names = {}
+        for name, size in DERIVATIVES.items():
+            resized = img.copy()
+            resized.thumbnail(size, Image.LANCZOS)
+            names[name] = derivative_name(stem, name, fmt)
+            # Written aside and renamed into place, a concurrent upload of the same bytes never truncates a file being served
+            partial = os.path.join(directory, f".{names[name]}.{secrets.token_hex(8)}")
+            try:
+                resized.save(partial, format=fmt.upper(), quality=85)
+                os.replace(partial, os.path.join(directory, names[name]))
+            except BaseException:
+                if os.path.exists(partial):
+                    os.remove(partial)
+                raise
+    return names
+
+async def process_upload(db : Session, kind : str, file : UploadFile):
+    """Stores an upload under STATIC_DIR/<kind> and returns its name, with a reference on it already taken and committed.
+    The caller points a row at it or gives the reference back with release."""
+    directory = os.path.join(STATIC_DIR, kind)
+    source, stem = await save_upload(file, directory)
+    file_name = derivative_name(stem, "full")
+    try:
+        # Referenced before looking at the files, remove_unreferenced can't delete them once we decided to reuse them
+        acquire(db, kind, file_name)
+        db.commit()
+    except BaseException:
+        os.remove(source)
+        raise
+    try:
+        # Re-uploads of an image that is already stored reuse its derivatives
+        if not all(os.path.exists(os.path.join(directory, derivative_name(stem, name))) for name in DERIVATIVES):
+            await asyncio.get_running_loop().run_in_executor(pool(), make_derivatives, source, directory, stem)
+    except BaseException as e:
+        # Unused, the reference is given back
+        orphaned = release(db, kind, file_name)
+        db.commit()
+        if orphaned:
+            remove_unreferenced(db, kind, file_name)
+        if isinstance(e, HTTPException) or not isinstance(e, Exception):
+            raise
+        raise HTTPException(
+            status_code=HTTPStatus.NOT_ACCEPTABLE,
+            detail="The uploaded image could not be read.",
+        )
+    finally:
+        os.remove(source)
+    return file_name
+
+# Remove every derivative of a stored image, only content addressed names are ever removed
+def remove_derivatives(directory : str, filename : str):
+    match = CONTENT_ADDRESSED.match(filename or "")
+    if not match:
+        return
+    for name in DERIVATIVES:
+        for fmt in EXTENSIONS:
+            try:
+                os.remove(os.path.join(directory, derivative_name(match["digest"], name, fmt)))
+            except FileNotFoundError:
+                pass
+
+#--------------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+
+# Reference counts: one images row per stored file set, counting the users / blogs pointing at it
+def acquire(db : Session, kind : str, filename : str):
+    if not CONTENT_ADDRESSED.match(filename or ""):
+        return
+    path = f"{kind}/{filename}"
+    if not db.query(StoredImage).filter(StoredImage.path==path).update({"refs" : StoredImage.refs + 1}):
+        db.add(StoredImage(path=path, refs=1))
+
+# Returns True when nothing references the file any more, remove it with remove_unreferenced after commit
+def release(db : Session, kind : str, filename : str):
+    if not CONTENT_ADDRESSED.match(filename or ""):
+        return False
+    path = f"{kind}/{filename}"
+    db.query(StoredImage).filter(StoredImage.path==path).update({"refs" : StoredImage.refs - 1})
+    refs = db.query(StoredImage.refs).filter(StoredImage.path==path).scalar()
+    return refs is not None and refs <= 0
+
+def remove_unreferenced(db : Session, kind : str, filename : str):
+    # Re-checks refs with the images row locked by the UPDATE, so an upload of the same bytes (acquire) waits
+    # until the files and the row are gone, then finds no files and writes them again
+    path = f"{kind}/{filename}"
+    try:
+        if not db.query(StoredImage).filter(StoredImage.path==path, StoredImage.refs <= 0).update({"refs" : StoredImage.refs}, synchronize_session=False):
+            db.rollback()
+            return False
+        remove_derivatives(os.path.join(STATIC_DIR, kind), filename)
+        db.query(StoredImage).filter(StoredImage.path==path).delete(synchronize_session=False)
+        db.commit()
+    except BaseException:
+        db.rollback()
+        raise
+    return True
+
+def collect_garbage(db : Session, kinds : tuple = ("users", "blogs")):
+    # Sweep content addressed files with no images row left, e.g. from uploads whose commit failed
+    removed = 0
+    for kind in kinds:
+        directory = os.path.join(STATIC_DIR, kind)
+        referenced = {path.split("/", 1)[1] for (path,) in db.query(StoredImage.path).filter(StoredImage.path.like(f"{kind}/%"))}
+        referenced = {CONTENT_ADDRESSED.match(name)["digest"] for name in referenced}
+        for filename in os.listdir(directory):
+            match = CONTENT_ADDRESSED.match(filename)
+            if match and match["digest"] not in referenced:
+                os.remove(os.path.join(directory, filename))
+                removed += 1
+    return removed
+
+class ImmutableStaticFiles(StaticFiles):
+    """Serves content addressed images with a strong ETag and a year long immutable Cache-Control."""
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        filename = os.path.basename(full_path)
+        if not CONTENT_ADDRESSED.match(filename):
+            return super().file_response(full_path, stat_result, scope, status_code)
+
+        # The name is derived from the bytes, so it is a strong validator that never changes
+        response = FileResponse(full_path, status_code=status_code, stat_result=stat_result, method=scope["method"])
+        response.headers["etag"] = f'"{filename}"'
+        response.headers["cache-control"] = "public, max-age=31536000, immutable"
+        if self.is_not_modified(response.headers, Headers(scope=scope)):
+            return NotModifiedResponse(response.headers)
+        return response
+
+if __name__ == "__main__":
+    # python images.py gc : remove stored images that are no longer referenced
+    if len(sys.argv) > 1 and sys.argv[1] == "gc":
+        from database import SessionLocal
+        db = SessionLocal()
+        try:
+            print(f"Removed {collect_garbage(db)} files.")
+        finally:
+            db.close()
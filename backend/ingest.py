@@ -0,0 +1,86 @@
+import hashlib
+import re
+from datetime import datetime
+import dateutil.parser as dparser
+from sqlalchemy.orm import Session
+from database import insert_ignore
+from models import News
+
+NEWS_FIELDS = ["author", "title", "description", "url", "urlToImage", "source", "content", "publishedAt"]
+
+# SQLite caps bound parameters per statement, so key lookups and inserts are chunked
+LOOKUP_CHUNK = 500
+
+_whitespace = re.compile(r"\s+")
+
+def normalize_title(title : str):
+    return _whitespace.sub(" ", (title or "").strip().lower())
+
+# Articles are deduplicated on the normalized title (as before), falling back to the url for untitled ones
+def dedup_key(title : str, url : str = None):
+    normalized = normalize_title(title) or (url or "").strip().lower()
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+def parse_published(value):
+    if isinstance(value, datetime) or value is None:
+        return value
+    # NewsAPI sends ISO 8601, only fall back to the slow fuzzy parser for anything else
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return dparser.parse(value, fuzzy=True)
+
+def to_row(article : dict):
+    row = {field : article.get(field) for field in NEWS_FIELDS}
+    if isinstance(row["source"], dict):
+        row["source"] = row["source"].get("name")
+    row["publishedAt"] = parse_published(row["publishedAt"])
+    row["dedupKey"] = dedup_key(row["title"], row["url"])
+    return row
+
+def existing_keys(db : Session, keys : list):
+    found = set()
+    for i in range(0, len(keys), LOOKUP_CHUNK):
+        chunk = keys[i:i + LOOKUP_CHUNK]
+        found.update(key for (key,) in db.query(News.dedupKey).filter(News.dedupKey.in_(chunk)))
+    return found
+
+def ingest_articles(db : Session, articles : list):
+    rows = {}
+    for article in articles:
+        row = to_row(article)
+        rows.setdefault(row["dedupKey"], row)
+
+    known = existing_keys(db, list(rows))
+    new_rows = [row for key, row in rows.items() if key not in known]
+
+    inserted = 0
+    if new_rows:
+        # One multi-row INSERT per chunk instead of one statement per article
+        # Rows are already filtered against existing keys, the unique index catches concurrent ingests
+        stmt = insert_ignore(db, News, ["dedupKey"])
+        for i in range(0, len(new_rows), LOOKUP_CHUNK):
+            chunk = new_rows[i:i + LOOKUP_CHUNK]
+            result = db.execute(stmt.values(chunk))
+            inserted += result.rowcount if result.rowcount >= 0 else len(chunk)
+        db.commit()
+
+    return {
+        "inserted" : inserted,
+        "skipped" : len(articles) - inserted,
+    }
+
+# Rows written before the dedupKey column existed, duplicates among them keep a NULL key
+def backfill_keys(db : Session, batch_size : int = 500):
+    last_id = 0
+    while True:
+        batch = db.query(News.n_id, News.title, News.url).filter(News.dedupKey == None, News.n_id > last_id).order_by(News.n_id).limit(batch_size).all()
+        if not batch:
+            break
+        keys = {}
+        for row in batch:
+            keys.setdefault(dedup_key(row.title, row.url), row.n_id)
+        known = existing_keys(db, list(keys))
+        db.bulk_update_mappings(News, [{"n_id" : n_id, "dedupKey" : key} for key, n_id in keys.items() if key not in known])
+        db.commit()
+        last_id = batch[-1].n_id
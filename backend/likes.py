@@ -0,0 +1,139 @@
+import asyncio
+from dotenv import dotenv_values
+from sqlalchemy import and_, bindparam, insert, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from cache import response_cache
+from database import SessionLocal, insert_ignore
+from models import Blog, BlogLike, User
+
+credentials = dotenv_values(".env")
+
+# LIKES_WRITE_BEHIND=1 buffers likes in memory and flushes them every LIKES_FLUSH_MS or LIKES_FLUSH_EVENTS likes
+WRITE_BEHIND = credentials.get('LIKES_WRITE_BEHIND', "0").lower() in ("1", "true", "yes")
+
+# Whether the blog exists and whether the user already liked it, in a single primary key lookup
+def like_state(db : Session, b_id : int, user_id : int):
+    row = db.query(Blog.b_id, BlogLike.userID).outerjoin(BlogLike, and_(BlogLike.blogID==Blog.b_id, BlogLike.userID==user_id)).filter(Blog.b_id==b_id).first()
+    if row is None:
+        return None
+    return row[1] is not None
+
+# Atomic path: the counter is incremented in SQL so no like is lost, the per-user row rejects duplicates.
+# The blog is updated first, a missing blog never gets a blog_likes row (a foreign key violation where they are enforced).
+# A duplicate is skipped by insert_ignore or raises where the dialect has no such INSERT (e.g. MSSQL), both roll the increment back
+def like_blog(db : Session, b_id : int, user_id : int):
+    if not db.query(Blog).filter(Blog.b_id==b_id).update({"likes" : Blog.likes + 1}, synchronize_session=False):
+        db.rollback()
+        return None
+    try:
+        inserted = db.execute(insert_ignore(db, BlogLike, ["blogID", "userID"]).values(blogID=b_id, userID=user_id)).rowcount
+    except IntegrityError:
+        inserted = 0
+    if not inserted:
+        db.rollback()
+        return False
+    db.commit()
+    return True
+
+def flush_likes(db : Session, pending : dict):
+    # Likes buffered for a blog or a user deleted since are dropped, one foreign key violation would fail
+    # the whole batch and it would be retried, and fail again, on every tick
+    blogs = {b_id for (b_id,) in db.query(Blog.b_id).filter(Blog.b_id.in_(list(pending)))}
+    likers = {user_id for (user_id,) in db.query(User.id).filter(User.id.in_(list(set().union(*pending.values()))))}
+    pending = {b_id : users & likers for b_id, users in pending.items() if b_id in blogs and users & likers}
+    pairs = [(b_id, user_id) for b_id, users in pending.items() for user_id in users]
+    existing = set()
+    for b_id, users in pending.items():
+        existing.update((b_id, user_id) for (user_id,) in db.query(BlogLike.userID).filter(BlogLike.blogID==b_id, BlogLike.userID.in_(users)))
+    new = [(b_id, user_id) for b_id, user_id in pairs if (b_id, user_id) not in existing]
+    if not new:
+        return 0
+
+    db.execute(insert(BlogLike), [{"blogID" : b_id, "userID" : user_id} for b_id, user_id in new])
+    deltas = {}
+    for b_id, _ in new:
+        deltas[b_id] = deltas.get(b_id, 0) + 1
+    # One executemany UPDATE for every blog touched since the last flush
+    db.execute(
+        update(Blog.__table__).where(Blog.__table__.c.b_id==bindparam("target")).values(likes=Blog.__table__.c.likes + bindparam("delta")),
+        [{"target" : b_id, "delta" : delta} for b_id, delta in deltas.items()],
+    )
+    db.commit()
+    return len(new)
+
+
+class LikeBuffer:
+    """Aggregates likes per blog in memory and writes them in batches."""
+
+    def __init__(self, interval_ms : int, max_events : int):
+        self.interval = interval_ms / 1000
+        self.max_events = max_events
+        self.flushed = 0
+        self._pending = {}
+        self._events = 0
+        self._wake = None
+        self._task = None
+
+    def is_pending(self, b_id : int, user_id : int):
+        return user_id in self._pending.get(b_id, ())
+
+    def add(self, b_id : int, user_id : int):
+        self._pending.setdefault(b_id, set()).add(user_id)
+        self._events += 1
+        if self._events >= self.max_events and self._wake is not None:
+            self._wake.set()
+
+    async def start(self):
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        # Flush whatever is still buffered on shutdown
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception:
+                # The batch was put back, retried on the next tick
+                pass
+
+    def _write(self, pending : dict):
+        db = SessionLocal()
+        try:
+            return flush_likes(db, pending)
+        finally:
+            db.close()
+
+    async def flush(self):
+        if not self._pending:
+            return 0
+        pending, self._pending, self._events = self._pending, {}, 0
+        try:
+            written = await asyncio.to_thread(self._write, pending)
+        except Exception:
+            for b_id, users in pending.items():
+                self._pending.setdefault(b_id, set()).update(users)
+                self._events += len(users)
+            raise
+        self.flushed += written
+        # Same as the synchronous path: the liked blogs are rebuilt, list pages catch up within CACHE_BLOG_TTL
+        if written:
+            response_cache.invalidate(*(f"blog:{b_id}" for b_id in pending))
+        return written
+
+like_buffer = LikeBuffer(
+    interval_ms=int(credentials.get('LIKES_FLUSH_MS', 500)),
+    max_events=int(credentials.get('LIKES_FLUSH_EVENTS', 1000)),
+)
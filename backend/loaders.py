@@ -0,0 +1,50 @@
+from functools import lru_cache
+from typing import Type
+from pydantic import BaseModel
+from sqlalchemy import inspect
+from sqlalchemy.orm import MANYTOONE, Session, joinedload, selectinload
+import models
+import schemas
+
+# Loader strategies derived from the response models: every nested pydantic field that
+# matches an ORM relationship is eager loaded, so serializing a page never falls back
+# to lazy loads (one SELECT per row per relationship).
+def _loader_options(model, schema : Type[BaseModel], parent=None):
+    options = []
+    relationships = inspect(model).relationships
+    for name, field in schema.__fields__.items():
+        if name not in relationships or not issubclass(field.type_, BaseModel):
+            continue
+        rel = relationships[name]
+        attr = getattr(model, name)
+
+        # Scalar references are joined into the same SELECT, collections get one extra
+        # `WHERE fk IN (...)` SELECT per page so LIMIT is never multiplied by a join.
+        if rel.direction == MANYTOONE:
+            option = parent.joinedload(attr) if parent is not None else joinedload(attr)
+        else:
+            option = parent.selectinload(attr) if parent is not None else selectinload(attr)
+
+        options.append(option)
+        options.extend(_loader_options(rel.mapper.class_, field.type_, parent=option))
+    return options
+
+@lru_cache(maxsize=None)
+def loader_options(model, schema : Type[BaseModel]):
+    return tuple(_loader_options(model, schema))
+
+def query_for(db : Session, model, schema : Type[BaseModel]):
+    return db.query(model).options(*loader_options(model, schema))
+
+# Column-only projection for summary models: one labelled column per field instead of full ORM entities,
+# so no identity map, relationship loading or attribute instrumentation per row.
+# computed maps fields that aren't columns of model to SQL expressions (joined columns, subqueries).
+def summary_query(db : Session, model, schema : Type[BaseModel], **computed):
+    columns = [computed[name].label(name) if name in computed else getattr(model, name).label(name) for name in schema.__fields__]
+    return db.query(*columns)
+
+# Blog list items: columns of the blog, its author and news item
+def blog_summaries(db : Session):
+    return summary_query(db, models.Blog, schemas.BlogSummary,
+                         authorName=models.User.fullname, newsTitle=models.News.title,
+                         ).outerjoin(models.User, models.User.id==models.Blog.authorID).outerjoin(models.News, models.News.n_id==models.Blog.newsID)
@@ -0,0 +1,185 @@
+import asyncio
+import json
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+import aiosmtplib
+from dotenv import dotenv_values
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+from sqlalchemy.orm import Session
+from database import SessionLocal
+from models import OutboxEmail
+
+credentials = dotenv_values(".env")
+
+# Transactional outbox: mails are rows written with the change that caused them (e.g. the new user),
+# MailSender delivers them in the background over a few long lived, authenticated SMTP connections.
+SMTP_HOST = credentials.get('SMTP_HOST', "smtp-mail.outlook.com")
+SMTP_PORT = int(credentials.get('SMTP_PORT', 587))
+SMTP_SECURITY = credentials.get('SMTP_SECURITY', "starttls") # starttls, ssl or none (e.g. a local sink)
+SMTP_AUTH = credentials.get('SMTP_AUTH', "1").lower() in ("1", "true", "yes")
+# A claimed batch is "sending" until this lease expires, then another sender may claim it again (e.g. after a crash)
+MAIL_LEASE_SECONDS = float(credentials.get('MAIL_LEASE_SECONDS', 300))
+
+# Templates are compiled once and cached by the environment, sending a mail only renders it
+templates = Environment(loader=FileSystemLoader("templates"), autoescape=select_autoescape(["html"]), auto_reload=False)
+
+def enqueue(db : Session, recipient : str, subject : str, template : str, **context):
+    # Committed by the caller, a rolled back sign-up never sends its mail
+    db.add(OutboxEmail(recipient=recipient, subject=subject, template=template, context=json.dumps(context),
+                       status="pending", attempts=0, nextAttemptAt=datetime.now(), createdAt=datetime.now()))
+
+def render(mail):
+    message = EmailMessage()
+    message["From"] = f"CSNB.in <{credentials.get('EMAIL')}>"
+    message["To"] = mail.recipient
+    message["Subject"] = mail.subject
+    message.set_content(templates.get_template(mail.template).render(**json.loads(mail.context)), subtype="html")
+    return message
+
+
+class MailSender:
+    """Sends due outbox mails in batches, failed sends are retried with exponential backoff."""
+
+    def __init__(self, connections : int, batch : int, poll : float, max_attempts : int, retry_base : float, max_backoff : float = 3600):
+        self.connections = connections
+        self.batch = batch
+        self.poll = poll
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.max_backoff = max_backoff
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self._wake = None
+        self._clients = None
+        self._task = None
+
+    def notify(self):
+        # Called after enqueue + commit, sends right away instead of at the next poll
+        if self._wake is not None:
+            self._wake.set()
+
+    async def start(self):
+        self._wake = asyncio.Event()
+        self._clients = asyncio.Queue()
+        for _ in range(self.connections):
+            self._clients.put_nowait(None) # connected on first use
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        while not self._clients.empty():
+            client = self._clients.get_nowait()
+            if client is not None and client.is_connected:
+                try:
+                    await client.quit()
+                except Exception:
+                    client.close()
+
+    async def _run(self):
+        while True:
+            try:
+                sent = await self.flush()
+            except Exception:
+                # Database unavailable, try again at the next poll
+                sent = 0
+            if sent < self.batch:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.poll)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+
+    def _claim(self):
+        # Several workers or instances poll the same outbox: each due row is taken by a conditional UPDATE
+        # in one transaction, and only the rows this sender updated are sent
+        claimable = (OutboxEmail.status.in_(("pending", "sending")), OutboxEmail.nextAttemptAt <= datetime.now())
+        db = SessionLocal()
+        try:
+            due = db.query(OutboxEmail.id).filter(*claimable).order_by(OutboxEmail.nextAttemptAt).limit(self.batch).all()
+            lease = datetime.now() + timedelta(seconds=MAIL_LEASE_SECONDS)
+            claimed = [mail_id for mail_id, in due
+                       if db.query(OutboxEmail).filter(OutboxEmail.id==mail_id, *claimable).update({"status" : "sending", "nextAttemptAt" : lease}, synchronize_session=False)]
+            db.commit()
+            if not claimed:
+                return []
+            return db.query(OutboxEmail.id, OutboxEmail.recipient, OutboxEmail.subject, OutboxEmail.template, OutboxEmail.context, OutboxEmail.attempts
+                            ).filter(OutboxEmail.id.in_(claimed)).all()
+        finally:
+            db.close()
+
+    def _record(self, results : list):
+        now = datetime.now()
+        updates = []
+        for mail, error in results:
+            attempts = mail.attempts + 1
+            if error is None:
+                updates.append({"id" : mail.id, "status" : "sent", "attempts" : attempts, "sentAt" : now, "lastError" : None})
+            elif attempts >= self.max_attempts:
+                updates.append({"id" : mail.id, "status" : "failed", "attempts" : attempts, "lastError" : error})
+            else:
+                retry_in = min(self.retry_base * 2 ** (attempts - 1), self.max_backoff)
+                updates.append({"id" : mail.id, "status" : "pending", "attempts" : attempts, "nextAttemptAt" : now + timedelta(seconds=retry_in), "lastError" : error})
+        db = SessionLocal()
+        try:
+            db.bulk_update_mappings(OutboxEmail, updates)
+            db.commit()
+        finally:
+            db.close()
+
+    async def flush(self):
+        mails = await asyncio.to_thread(self._claim)
+        if not mails:
+            return 0
+        results = await asyncio.gather(*(self._send(mail) for mail in mails))
+        await asyncio.to_thread(self._record, results)
+        return len(mails)
+
+    async def _connect(self):
+        client = aiosmtplib.SMTP(hostname=SMTP_HOST, port=SMTP_PORT, use_tls=SMTP_SECURITY == "ssl", start_tls=SMTP_SECURITY == "starttls")
+        await client.connect()
+        if SMTP_AUTH:
+            await client.login(credentials['EMAIL'], credentials['PASSWORD'])
+        return client
+
+    async def _send(self, mail):
+        # At most `connections` sends run at once, each on a connection it has to itself
+        client = await self._clients.get()
+        try:
+            if client is None or not client.is_connected:
+                client = await self._connect()
+            await client.send_message(render(mail))
+            self.sent += 1
+            return mail, None
+        except Exception as e:
+            if mail.attempts + 1 >= self.max_attempts:
+                self.failed += 1
+            else:
+                self.retried += 1
+            # The connection may be broken, the next send reconnects
+            if client is not None:
+                client.close()
+            client = None
+            return mail, f"{type(e).__name__}: {e}"
+        finally:
+            self._clients.put_nowait(client)
+
+    def stats(self):
+        return {
+            "connections" : self.connections,
+            "sent" : self.sent,
+            "retried" : self.retried,
+            "failed" : self.failed,
+        }
+
+mail_sender = MailSender(
+    connections=int(credentials.get('MAIL_CONNECTIONS', 2)),
+    batch=int(credentials.get('MAIL_BATCH', 50)),
+    poll=float(credentials.get('MAIL_POLL', 5)),
+    max_attempts=int(credentials.get('MAIL_MAX_ATTEMPTS', 8)),
+    retry_base=float(credentials.get('MAIL_RETRY_SECONDS', 30)),
+)
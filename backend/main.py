@@ -1,36 +1,48 @@
 import datetime
-import secrets
 from http import HTTPStatus
-from analytics import analyze
-import dateutil.parser as dparser
+from analytics import LABELS, analyze, backfill, registry
 import models
-import requests
 import schemas
 from authentication import *
-from better_profanity import profanity
+from cache import BLOG_TTL, NEWS_TTL, response_cache
+from counts import adjust_comment_count
 from database import SessionLocal, engine
+from export import FORMATS, TABLES, export_rows
+from images import STATIC_DIR, ImmutableStaticFiles, process_upload, release, remove_unreferenced
+from images import shutdown as shutdown_image_pool
+from ingest import backfill_keys
+from newsfetch import news_client
 from fastapi import (Depends, FastAPI, File, HTTPException, Query, Request,
                      UploadFile)
+from typing import List
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, ORJSONResponse, Response, StreamingResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from fastapi_pagination import Page, add_pagination, paginate
-from PIL import Image
+from fastapi_pagination import add_pagination
+from likes import WRITE_BEHIND, like_blog, like_buffer, like_state
+from loaders import blog_summaries, query_for, summary_query
+from mailer import mail_sender
+from metrics import MetricsMiddleware, gauge_from
+from metrics import render as render_metrics
+from migrations import migrate
+from pagination import KeysetPage, KeysetParams, paginate
+from principals import principals
+from profiling import ProfilingMiddleware
+from profanity_filter import profanity
+from scheduler import scheduler
+from search import SOURCES, search
+from sessions import get_read_db, get_write_db
+from sqlalchemy import case, func
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
 from sqlalchemy.orm import Session
-import pandas as pd
 models.Base.metadata.create_all(bind=engine)
+migrate(engine)
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-# Intialize App
-app = FastAPI()
+# GET routes read through get_read_db (replicas / read-only pool), everything else writes through get_write_db
+# Intialize App, responses are rendered with orjson
+app = FastAPI(default_response_class=ORJSONResponse)
 
 # Creating app server port for frontend
 origins = {
@@ -51,6 +63,20 @@ app.add_middleware(
 oath2_scheme = OAuth2PasswordBearer(tokenUrl='token')
 templates = Jinja2Templates(directory="templates")
 
+# Fit or load the sentiment model once instead of on the first analytics request
+@app.on_event("startup")
+def load_sentiment_model():
+    registry.get()
+
+# Give news rows stored before dedupKey existed a key, a no-op once every row has one
+@app.on_event("startup")
+def backfill_news_keys():
+    db = SessionLocal()
+    try:
+        backfill_keys(db)
+    finally:
+        db.close()
+
 # Root / Index 
 @app.get('/',tags=['Root'])
 def root():
@@ -60,94 +86,166 @@ def root():
             headers={"WWW-Authenticate":"Bearer"}
         )
 
-app.mount('/static',StaticFiles(directory=r'C:\Users\Bharg\CyberSecNewsBlog\backend\static'),name="static")
+# Prometheus scrape endpoint
+@app.get('/metrics',tags=['Root'],include_in_schema=False)
+def metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+app.mount('/static',ImmutableStaticFiles(directory=STATIC_DIR),name="static")
 #-----------------------------------------------------------------------------Token Api---------------------------------------------------------------------------------------------------
 
 # Token api
 @app.post('/token',tags=['Login Token'])
-async def generate_token(form_data : OAuth2PasswordRequestForm = Depends(),db : Session = Depends(get_db)):
+async def generate_token(form_data : OAuth2PasswordRequestForm = Depends(),db : Session = Depends(get_write_db)):
     token = await token_gen(form_data.username, form_data.password,db=db)
     return {"access_token": token, "token_type" : "Bearer"}
 
 # Getting current authorized user
-async def get_current_user(token : str = Depends(oath2_scheme),db : Session = Depends(get_db)):
+def load_principal(token : str):
+    decoded_token = jtoken.decode(token,credentials['SECRET'],algorithms=[credentials['Algorithm']])
+    username = decoded_token.get('username')
+    user = principals.get(username)
+    if user is None:
+        # User and admin row in one round-trip, cached until the TTL expires or the user changes.
+        # Read from the primary: a lagging read engine would cache a stale principal for everyone until the TTL
+        db = SessionLocal()
+        try:
+            row = db.query(models.User,models.Admin.id).outerjoin(models.Admin,models.Admin.userID==models.User.id).filter(models.User.username==username).first()
+        finally:
+            db.close()
+        if row:
+            user = schemas.Principal.from_orm(row[0])
+            user.adminID = row[1]
+            principals.set(username,user)
+    return user
+
+async def get_current_user(token : str = Depends(oath2_scheme)):
     try:
-        decoded_token = jtoken.decode(token,credentials['SECRET'],algorithms=[credentials['Algorithm']])
-        user = db.query(models.User).filter(models.User.username==decoded_token.get('username')).first()
+        user = load_principal(token)
     except:
+        user = None
+    # Also a valid token whose user is gone (deleted account, renamed username), routes never see None
+    if user is None:
         raise HTTPException(
             status_code=HTTPStatus.NOT_FOUND,
             detail="Invalid username or password",
             headers={"WWW-Authenticate":"Bearer"}
         )
     return user
+
+# Admin check for middleware (request profiling), outside of FastAPI's dependencies
+async def is_admin_request(scope):
+    scheme, _, token = Headers(scope=scope).get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer":
+        return False
+    try:
+        user = await run_in_threadpool(load_principal,token)
+    except Exception:
+        return False
+    return bool(user and user.adminID)
+
+# On demand / sampled request profiles, see profiling.py
+app.add_middleware(ProfilingMiddleware, authorize=is_admin_request)
+# Per route latency, size and SQL metrics on /metrics, outermost so it also times the other middleware
+app.add_middleware(MetricsMiddleware, routes=app.routes)
+gauge_from("bcrypt_pool_in_flight", "Passwords being hashed or verified", lambda : hashing_pool.stats()["in_flight"])
+gauge_from("bcrypt_pool_queued", "Passwords waiting for a bcrypt worker", lambda : hashing_pool.stats()["queued"])
+gauge_from("bcrypt_pool_rejected", "Hash requests rejected with 503 since start", lambda : hashing_pool.rejected)
+gauge_from("response_cache_hits", "Cached responses served since start", lambda : response_cache.hits)
+gauge_from("response_cache_misses", "Cacheable responses built since start", lambda : response_cache.misses)
+gauge_from("mail_sent", "Outbox mails delivered since start", lambda : mail_sender.sent)
+gauge_from("mail_failed", "Outbox mails given up on since start", lambda : mail_sender.failed)
 #------------------------------------------------------------------Admin Api--------------------------------------------------------------------------------------------------------------
 @app.post("/admin/register", tags=['Admin'],status_code=HTTPStatus.CREATED)
-async def registerAdmin(user : schemas.User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def registerAdmin(user : schemas.User = Depends(get_current_user), db: Session = Depends(get_write_db)):
+    if user.adminID:
+        raise HTTPException(
+            status_code=HTTPStatus.BAD_REQUEST,
+            detail="Already an Admin.",
+        )
     new_admin = models.Admin(userID=user.id)
 
     db.add(new_admin)
     db.commit()
     db.refresh(new_admin)
+    principals.invalidate(user.username)
 
     return{
         "detail" : f"Welcome to CSNB.in Admin, {new_admin.user.fullname}."
     }
 
 @app.post("/admin/{b_id}/approve",tags=['Admin'],status_code=HTTPStatus.ACCEPTED)
-async def approveBlogs(b_id : int,user : schemas.User = Depends(get_current_user), db: Session = Depends(get_db)):
-    admin = db.query(models.Admin).filter(models.Admin.user==user).first()
-    if not admin:
+async def approveBlogs(b_id : int,user : schemas.User = Depends(get_current_user), db: Session = Depends(get_write_db)):
+    if not user.adminID:
         raise HTTPException(
             status_code=HTTPStatus.UNAUTHORIZED,
             detail="Not Authorised to perform this action",
         )
     qry = db.query(models.Blog).filter(models.Blog.b_id==b_id)
-    qry.update({"approved":True,"approverID":admin.id})
+    qry.update({"approved":True,"approverID":user.adminID})
     db.commit()
+    response_cache.invalidate("blogs",f"blog:{b_id}")
     return {
         "detail" : "Blog Approved."
     }
 
-@app.get("/admin/blogs/{filter}",tags=['Admin'],status_code=HTTPStatus.ACCEPTED,response_model=Page[schemas.Blog])
-async def filteredBlogs(filter : bool,user : schemas.User = Depends(get_current_user), db: Session = Depends(get_db)):
-    admin = db.query(models.Admin).filter(models.Admin.user==user).first()
-    if not admin:
+@app.get("/admin/blogs/{filter}",tags=['Admin'],status_code=HTTPStatus.ACCEPTED,response_model=KeysetPage[schemas.BlogSummary])
+async def filteredBlogs(filter : bool,user : schemas.User = Depends(get_current_user), db: Session = Depends(get_read_db)):
+    if not user.adminID:
         raise HTTPException(
             status_code=HTTPStatus.UNAUTHORIZED,
             detail="Not Authorised to perform this action",
         )
-    blogs = db.query(models.Blog).filter(models.Blog.approved==filter).all()
-    if not blogs:
+    blogs = paginate(blog_summaries(db).filter(models.Blog.approved==filter),models.Blog.b_id)
+    if not blogs.items:
             raise HTTPException(
             status_code=HTTPStatus.NO_CONTENT,
             detail="No Blogs.",
             ) 
-    return paginate(blogs)
+    return blogs
 
-@app.get("/admin/users/{filter}",tags=['Admin'],status_code=HTTPStatus.ACCEPTED,response_model=Page[schemas.User])
-async def filteredUsers(filter : str, user : schemas.User = Depends(get_current_user), db: Session = Depends(get_db)):
-    admin = db.query(models.Admin).filter(models.Admin.user==user).first()
-    if not admin:
+@app.get("/admin/users/{filter}",tags=['Admin'],status_code=HTTPStatus.ACCEPTED,response_model=KeysetPage[schemas.User])
+async def filteredUsers(filter : str, user : schemas.User = Depends(get_current_user), db: Session = Depends(get_read_db)):
+    if not user.adminID:
         raise HTTPException(
             status_code=HTTPStatus.UNAUTHORIZED,
             detail="Not Authorised to perform this action",
         )
-    users = db.query(models.User).filter(models.User.gender==filter.lower()).all()
-    if not users:
+    users = paginate(db.query(models.User).filter(models.User.gender==filter.lower()),models.User.id)
+    if not users.items:
         raise HTTPException(
         status_code=HTTPStatus.NO_CONTENT,
         detail="No users of that gender.",
         ) 
-    return paginate(users)
+    return users
+
+# Streams the whole table (or rows published since) as NDJSON or CSV, gzipped when the client accepts it
+@app.get("/admin/export/{table}",tags=['Admin'],status_code=HTTPStatus.OK)
+async def export_table(table : str,request : Request,format : str = Query("ndjson", description="ndjson or csv"),since : datetime.datetime | None = None,user : schemas.User = Depends(get_current_user)):
+    if not user.adminID:
+        raise HTTPException(
+            status_code=HTTPStatus.UNAUTHORIZED,
+            detail="Not Authorised to perform this action",
+        )
+    if table not in TABLES or format not in FORMATS:
+        raise HTTPException(
+            status_code=HTTPStatus.BAD_REQUEST,
+            detail=f"Export one of {list(TABLES)} as one of {list(FORMATS)}.",
+        )
+    gzip = "gzip" in request.headers.get("accept-encoding", "")
+    headers = {"Content-Disposition" : f'attachment; filename="{table}.{format}"'}
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(export_rows(table, format, since=since, gzip=gzip), media_type=FORMATS[format], headers=headers)
 
 #-------------------------------------------------------------User Api-------------------------------------------------------------------------------------------------------------------
 
 
 @app.post("/user/register", tags=['User'],status_code=HTTPStatus.CREATED)
-async def register(user : schemas.UserCreate, db: Session = Depends(get_db)):
+async def register(user : schemas.UserCreate, db: Session = Depends(get_write_db)):
     user_info = user.dict(exclude_unset=True)
-    user_info["password"] = hash_password(user_info["password"])
+    user_info["password"] = await hash_password(user_info["password"])
     user_info["gender"] = str(user_info["gender"]).lower()
     
     if db.query(models.User).filter(models.User.username==user_info["username"]).first():
@@ -160,13 +258,25 @@ async def register(user : schemas.UserCreate, db: Session = Depends(get_db)):
         new_user = models.User(**user_info)
 
         db.add(new_user)
+        queue_verification(db,new_user)
         db.commit()
         db.refresh(new_user)
+        mail_sender.notify()
 
         return{
             "detail" : f"Welcome to CSNB.in, {new_user.fullname}, Thanks for Choosing Our Service, Please Verify your Email."
         }
 
+@app.get("/user/verify/", tags=['User'],status_code=HTTPStatus.OK,response_class=HTMLResponse)
+async def verify_email(request : Request,token : str,db: Session = Depends(get_read_db)):
+    user = verify_token(token,db)
+    if not user:
+        raise HTTPException(
+            status_code=HTTPStatus.NOT_FOUND,
+            detail="Not Found.",
+        )
+    return templates.TemplateResponse("verification.html",{"request" : request, "username" : user.username})
+
 @app.post("/user/login",tags=['User'],status_code=HTTPStatus.OK,response_model=schemas.User)
 async def login(user : schemas.User = Depends(get_current_user)):
     if not user:
@@ -179,17 +289,23 @@ async def login(user : schemas.User = Depends(get_current_user)):
 
 # Deleting User 
 @app.delete("/user/remove",tags=['User'],status_code=HTTPStatus.ACCEPTED)
-async def delete_account(db: Session = Depends(get_db),user : schemas.User = Depends(get_current_user)):
+async def delete_account(db: Session = Depends(get_write_db),user : schemas.User = Depends(get_current_user)):
+        orphaned = release(db, "users", user.profilePicture)
         db.query(models.User).filter(models.User.id == user.id).delete()
         db.commit()
+        principals.invalidate(user.username)
+        response_cache.invalidate("users","blogs")
+        if orphaned:
+            remove_unreferenced(db, "users", user.profilePicture)
         return{
             "detail" : "Your Profile has been removed, Sorry to see you go."
         }
 
 
 @app.put("/user/update", tags=['User'],status_code=HTTPStatus.ACCEPTED)
-async def update_user(user_info : schemas.User,user : schemas.User = Depends(get_current_user),db: Session = Depends(get_db)):
-    updated_user_info = user_info.dict(exclude_unset=True)
+async def update_user(user_info : schemas.User,user : schemas.User = Depends(get_current_user),db: Session = Depends(get_write_db)):
+    # The picture only changes through upload_profile, which keeps the image reference counts
+    updated_user_info = user_info.dict(exclude_unset=True,exclude={"id","profilePicture","createdAt"})
 
     if db.query(models.User).filter(models.User.id!=user.id).filter(models.User.username==updated_user_info["username"]).first():
         raise HTTPException(
@@ -200,111 +316,117 @@ async def update_user(user_info : schemas.User,user : schemas.User = Depends(get
     else:     
         db.query(models.User).filter(models.User.id == user.id).update(updated_user_info)
         db.commit()
+        principals.invalidate(user.username)
+        response_cache.invalidate("users")
     
         return {'data' : 'Blog Content is updated sucessfully!'}
 
 @app.put("/user/resetpassword", tags=['User'],status_code=HTTPStatus.ACCEPTED)
-async def reset_password(user_password : str,user : schemas.User = Depends(get_current_user),db: Session = Depends(get_db)):
-    user_password = hash_password(user_password)
+async def reset_password(user_password : str,user : schemas.User = Depends(get_current_user),db: Session = Depends(get_write_db)):
+    user_password = await hash_password(user_password)
     db.query(models.User).filter(models.User.id == user.id).update({"password":user_password})
     db.commit()
+    principals.invalidate(user.username)
 
     return {'data' : 'Password is updated sucessfully!'}        
 
 @app.post("/user/upload/profile", tags=['User'],status_code=HTTPStatus.OK)
-async def upload_profile(db: Session = Depends(get_db),file:UploadFile = File(...),user: schemas.User = Depends(get_current_user)):
-    
-    FILEPATH = "C:/Users/Bharg/CyberSecNewsBlog/backend/static/users/"
-    filename = file.filename
-    extension = filename.split(".")[1]
-    
-    if extension not in ['png','jpg','jpeg']:
-        raise HTTPException(
-            status_code=HTTPStatus.NOT_ACCEPTABLE,
-            detail="Please Upload a png or jpg.",
-        )
-        
-    if user.profilePicture == "UserDefault.jpg":
-        # Generate a random hex and add to to file-name to avoid duplication of news image names
-        file_name = secrets.token_hex(10) + "." + extension
-        _genFilename = FILEPATH + file_name
-        _content = await file.read()
-        
-        with open(_genFilename,'wb') as file:
-            file.write(_content)
-            
-        #Limiting image size to save server space using PILLOW
-        img = Image.open(_genFilename)
-        img = img.resize(size=(470,960))
-        file.close()
-        
+async def upload_profile(db: Session = Depends(get_write_db),file:UploadFile = File(...),user: schemas.User = Depends(get_current_user)):
+    # Comes back referenced, the reference moves to the user or is given back
+    file_name = await process_upload(db, "users", file)
+
+    if file_name != user.profilePicture:
+        orphaned = release(db, "users", user.profilePicture)
         db.query(models.User).filter(models.User.id==user.id).update({"profilePicture": file_name})
         db.commit()
-        db.refresh(User)
-            
-        return {'status' : 'User Image Uploaded'}
-    
+        principals.invalidate(user.username)
+        response_cache.invalidate("users")
+        if orphaned:
+            remove_unreferenced(db, "users", user.profilePicture)
     else:
-        currentfile = FILEPATH + User.profilePicture
-        _content = await file.read()
-
-        with open(currentfile,'wb') as newfile:
-            newfile.write(_content)
-        
-        img = Image.open(currentfile)
-        img = img.resize(size=(470,960))
-        await file.close()
+        release(db, "users", file_name)
+        db.commit()
 
-        return {'status' : 'User Image Updated.'}
+    if user.profilePicture == "UserDefault.jpg":
+        return {'status' : 'User Image Uploaded'}
+    return {'status' : 'User Image Updated.'}
     
 
 #------------------------------------------------------------------News Api--------------------------------------------------------------------------------------------------------------
 
-def fetchCategoryNews(category : str):
-    news = requests.get(url=f"https://newsapi.org/v2/everything?q={category}&apiKey={credentials['KEY']}")
-    articles = news.json()["articles"]
-    return articles
+# Background workers: news ingestion (NEWS_CATEGORIES every NEWS_INTERVAL seconds) and the email outbox sender
+@app.on_event("startup")
+async def start_news_scheduler():
+    await scheduler.start()
+    await mail_sender.start()
+    if WRITE_BEHIND:
+        await like_buffer.start()
+
+@app.on_event("shutdown")
+async def stop_background_workers():
+    await scheduler.stop()
+    await like_buffer.stop()
+    await mail_sender.stop()
+    await news_client.close()
+    shutdown_image_pool()
+
+@app.post("/news/{category}", tags=['News'],status_code=HTTPStatus.ACCEPTED)
+async def fetch_News(category : str,user : schemas.User = Depends(get_current_user)):
+    if not user.adminID:
+        raise HTTPException(
+            status_code=HTTPStatus.UNAUTHORIZED,
+            detail="Not Authorised to perform this action",
+        )
+    # The cached news pages are invalidated by the scheduler once the refresh inserts rows
+    scheduler.enqueue(category)
+    return {
+        "detail" : "News refresh queued."
+    }
 
-@app.post("/news/{category}", tags=['News'],status_code=HTTPStatus.CREATED)
-async def fetch_News(category : str,user : schemas.User = Depends(get_current_user),db: Session = Depends(get_db)):
-    admin = db.query(models.Admin).filter(models.Admin.user==user).first()
-    if not admin:
+@app.get("/news/ingest/stats", tags=['News'],status_code=HTTPStatus.OK)
+async def news_ingest_stats(user : schemas.User = Depends(get_current_user)):
+    if not user.adminID:
         raise HTTPException(
             status_code=HTTPStatus.UNAUTHORIZED,
             detail="Not Authorised to perform this action",
         )
-    articles = fetchCategoryNews(category=category)
-    for article in articles:
-        if db.query(models.News).filter(models.News.title==article['title']).first():
-            continue
-        article["source"] = article["source"]["name"]
-        article["publishedAt"] = dparser.parse(article["publishedAt"] ,fuzzy=True)
-        new_article = models.News(**article)
-        db.add(new_article)
-    db.commit()
     return {
-        "detail" : "News Successfully Fetched."
+        "categories" : scheduler.categories,
+        "interval" : scheduler.interval,
+        "stats" : scheduler.stats,
     }
 
-@app.get("/news/TopHeadline",tags=["News"],status_code=HTTPStatus.OK)
-async def get_top_headline(user : schemas.User = Depends(get_current_user),db : Session = Depends(get_db)):
+@app.get("/news/TopHeadline",tags=["News"],status_code=HTTPStatus.OK,response_model=schemas.News | None)
+@response_cache.cached(NEWS_TTL, tags=["news"], model=schemas.News | None)
+async def get_top_headline(user : schemas.User = Depends(get_current_user),db : Session = Depends(get_read_db)):
     headline = db.query(models.News).order_by(models.News.publishedAt).first()
     return headline
 
 
-@app.get('/news/all',tags=["News"],status_code=HTTPStatus.OK,response_model=Page[schemas.News])
-async def get_news(user : schemas.User = Depends(get_current_user),db: Session = Depends(get_db)):
-        news = db.query(models.News).all()
-        if not news:
+@app.get('/news/all',tags=["News"],status_code=HTTPStatus.OK,response_model=KeysetPage[schemas.NewsSummary])
+@response_cache.cached(NEWS_TTL, tags=["news"], model=KeysetPage[schemas.NewsSummary])
+async def get_news(user : schemas.User = Depends(get_current_user),db: Session = Depends(get_read_db)):
+        news = paginate(summary_query(db,models.News,schemas.NewsSummary),models.News.n_id)
+        if not news.items:
             raise HTTPException(
             status_code=HTTPStatus.NO_CONTENT,
             detail="No Content.",
             ) 
-        return paginate(news)
+        return news
+
+@app.get('/news/{n_id}',tags=["News"],status_code=HTTPStatus.OK,response_model=schemas.News)
+async def get_news_item(n_id : int,user : schemas.User = Depends(get_current_user),db: Session = Depends(get_read_db)):
+        news = db.query(models.News).filter(models.News.n_id==n_id).first()
+        if not news:
+            raise HTTPException(
+                status_code=HTTPStatus.NOT_FOUND,
+                detail="Not Found.",
+            )
+        return news
 
 #------------------------------------------------------------------Blog Api--------------------------------------------------------------------------------------------------------------
 @app.post("/blog/{newsId}/upload",tags=['Blog'],status_code=HTTPStatus.OK)
-async def blog_upload(newsId : int ,blog : schemas.BlogBase ,user : models.User = Depends(get_current_user),db: Session = Depends(get_db)):
+async def blog_upload(newsId : int ,blog : schemas.BlogBase ,user : models.User = Depends(get_current_user),db: Session = Depends(get_write_db)):
     blog_info = blog.dict(exclude_unset=True)
     news = db.query(models.News).filter(models.News.n_id==newsId).first()
     if not news:
@@ -324,75 +446,58 @@ async def blog_upload(newsId : int ,blog : schemas.BlogBase ,user : models.User
     }
 
 @app.post("/blog/{b_id}/banner", tags=['Blog'],status_code=HTTPStatus.OK)
-async def upload_banner(b_id : int, db: Session = Depends(get_db),file:UploadFile = File(...),user: schemas.User = Depends(get_current_user)):
+async def upload_banner(b_id : int, db: Session = Depends(get_write_db),file:UploadFile = File(...),user: schemas.User = Depends(get_current_user)):
     qry = db.query(models.Blog).filter(models.Blog.b_id==b_id)
     blog = qry.first()
-    FILEPATH = "C:/Users/Bharg/CyberSecNewsBlog/backend/static/blogs/"
-    filename = file.filename
-    extension = filename.split(".")[1]
-    
-    if extension not in ['png','jpg','jpeg']:
+    if not blog:
         raise HTTPException(
-            status_code=HTTPStatus.NOT_ACCEPTABLE,
-            detail="Please Upload a png or jpg.",
+            status_code=HTTPStatus.NOT_FOUND,
+            detail="Not Found.",
         )
 
-    if blog.banner == "BlogDefault.png":
-        # Generate a random hex and add to to file-name to avoid duplication of news image names
-        file_name = secrets.token_hex(10) + "." + extension
-        _genFilename = FILEPATH + file_name
-        _content = await file.read()
-        
-        with open(_genFilename,'wb') as file:
-            file.write(_content)
-            
-        #Limiting image size to save server space using PILLOW
-        img = Image.open(_genFilename)
-        img = img.resize(size=(470,960))
-        file.close()
-        
+    previous = blog.banner
+    file_name = await process_upload(db, "blogs", file)
+
+    if file_name != previous:
+        orphaned = release(db, "blogs", previous)
         qry.update({"banner": file_name})
         db.commit()
-        db.refresh(User)
-            
-        return {'status' : 'Blog Banner Uploaded'}
-    
+        response_cache.invalidate("blogs",f"blog:{b_id}")
+        if orphaned:
+            remove_unreferenced(db, "blogs", previous)
     else:
-        currentfile = FILEPATH + blog.banner
-        _content = await file.read()
-
-        with open(currentfile,'wb') as newfile:
-            newfile.write(_content)
-        
-        img = Image.open(currentfile)
-        img = img.resize(size=(470,960))
-        await file.close()
+        release(db, "blogs", file_name)
+        db.commit()
 
-        return {'status' : 'Blog Banner Updated.'}
+    if previous == "BlogDefault.png":
+        return {'status' : 'Blog Banner Uploaded'}
+    return {'status' : 'Blog Banner Updated.'}
 
-@app.get('/blog/all',tags=["Blog"],status_code=HTTPStatus.OK,response_model=Page[schemas.Blog])
-async def get_blogs(user : models.User = Depends(get_current_user),db: Session = Depends(get_db)):
+@app.get('/blog/all',tags=["Blog"],status_code=HTTPStatus.OK,response_model=KeysetPage[schemas.BlogSummary])
+@response_cache.cached(BLOG_TTL, tags=["blogs","users"], model=KeysetPage[schemas.BlogSummary])
+async def get_blogs(user : models.User = Depends(get_current_user),db: Session = Depends(get_read_db)):
         if not user:
             raise HTTPException(
                 status_code=HTTPStatus.UNAUTHORIZED,
                 detail="You are not Authorized.",
             )
-        blogs = db.query(models.Blog).filter(models.Blog.approved == True).all()
-        if not blogs:
+        blogs = paginate(blog_summaries(db).filter(models.Blog.approved == True),models.Blog.b_id)
+        if not blogs.items:
             raise HTTPException(
             status_code=HTTPStatus.NO_CONTENT,
             detail="No Content.",
             ) 
-        return paginate(blogs)
+        return blogs
 
 @app.get('/blog/{b_id}',tags=["Blog"],status_code=HTTPStatus.OK,response_model=schemas.Blog)
-async def get_blog(b_id : int,user : models.User = Depends(get_current_user) ,db: Session = Depends(get_db)):
+@response_cache.cached(BLOG_TTL, tags=lambda b_id, **_ : [f"blog:{b_id}","users"], model=schemas.Blog)
+async def get_blog(b_id : int,user : models.User = Depends(get_current_user) ,db: Session = Depends(get_read_db)):
         if not user:
             raise HTTPException(
                 status_code=HTTPStatus.UNAUTHORIZED,
                 detail="You are not Authorized.",
             )
-        blog = db.query(models.Blog).filter(models.Blog.b_id==b_id).first()
+        blog = query_for(db,models.Blog,schemas.Blog).filter(models.Blog.b_id==b_id).first()
         if not blog:
             raise HTTPException(
                 status_code=HTTPStatus.NOT_FOUND,
@@ -400,18 +505,52 @@ async def get_blog(b_id : int,user : models.User = Depends(get_current_user) ,db
             ) 
         return blog
 
+@app.get('/blog/{b_id}/comments',tags=["Comments"],status_code=HTTPStatus.OK,response_model=KeysetPage[schemas.Comment])
+async def get_comments(b_id : int,user : schemas.User = Depends(get_current_user),db: Session = Depends(get_read_db)):
+        if not db.query(models.Blog.b_id).filter(models.Blog.b_id==b_id).first():
+            raise HTTPException(
+                status_code=HTTPStatus.NOT_FOUND,
+                detail="Not Found.",
+            )
+        # Oldest first, c_id orders comments published in the same instant
+        comments = query_for(db,models.Comment,schemas.Comment).filter(models.Comment.blogID==b_id)
+        return paginate(comments,(models.Comment.publishedAt,models.Comment.c_id))
+
 @app.post("/blog/{b_id}/like",tags=['Blog'],status_code=HTTPStatus.ACCEPTED)
-async def likeBlog(b_id : int,user : schemas.User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def likeBlog(b_id : int,user : schemas.User = Depends(get_current_user), db: Session = Depends(get_write_db)):
     
-    qry = db.query(models.Blog).filter(models.Blog.b_id==b_id)
-    qry.update({"likes":qry.first().likes + 1})
-    db.commit()
+    if WRITE_BEHIND:
+        # Buffered, the counter is written by like_buffer in the next batched flush
+        if like_buffer.is_pending(b_id,user.id):
+            liked = False
+        else:
+            state = like_state(db,b_id,user.id)
+            liked = None if state is None else not state
+            if liked:
+                like_buffer.add(b_id,user.id)
+    else:
+        liked = like_blog(db,b_id,user.id)
+
+    if liked is None:
+        raise HTTPException(
+            status_code=HTTPStatus.NOT_FOUND,
+            detail="Not Found.",
+        )
+    if not liked:
+        raise HTTPException(
+            status_code=HTTPStatus.CONFLICT,
+            detail="Blog already liked.",
+        )
+    if not WRITE_BEHIND:
+        # Only the blog itself: like counts on cached /blog/all pages may lag by up to CACHE_BLOG_TTL,
+        # invalidating "blogs" here would rebuild every list page on each click
+        response_cache.invalidate(f"blog:{b_id}")
     return {
         "detail" : "Blog Liked."
     }
 
 @app.delete('/blog/{b_id}/remove',tags=['Blog'],status_code=HTTPStatus.OK)
-async def blog_remove(b_id: int,user : schemas.User = Depends(get_current_user),db: Session = Depends(get_db)):
+async def blog_remove(b_id: int,user : schemas.User = Depends(get_current_user),db: Session = Depends(get_write_db)):
     qry = db.query(models.Blog).filter(models.Blog.b_id==b_id)
     blog = qry.first()
     if blog.authorID != user.id:    
@@ -420,12 +559,17 @@ async def blog_remove(b_id: int,user : schemas.User = Depends(get_current_user),
             detail="Not Authorized to perform this action.",
         )
 
+    banner = blog.banner # the deleted blog can't be read after the commit
+    orphaned = release(db, "blogs", banner)
     qry.delete()
     db.commit()
+    response_cache.invalidate("blogs",f"blog:{b_id}")
+    if orphaned:
+        remove_unreferenced(db, "blogs", banner)
     return{'data' : 'The requested blog has been removed.'}
 #------------------------------------------------------------------Comment Api--------------------------------------------------------------------------------------------------------------
 @app.post("/blog/{b_id}/comment/upload",tags=['Comments'],status_code=HTTPStatus.OK)
-async def comment_upload(b_id : int,comment : schemas.CommentBase, user : models.User = Depends(get_current_user),db: Session = Depends(get_db)):
+async def comment_upload(b_id : int,comment : schemas.CommentBase, user : models.User = Depends(get_current_user),db: Session = Depends(get_write_db)):
     comment_content = comment.dict(exclude_unset=True)
     blog = db.query(models.Blog).filter(models.Blog.b_id==b_id).first()
     if not blog:
@@ -435,18 +579,21 @@ async def comment_upload(b_id : int,comment : schemas.CommentBase, user : models
         )
     
     comment_content["description"] = profanity.censor(comment_content["description"])
+    comment_content["sentiment"] = analyze([comment_content["description"]])[0]
 
     new_comment = models.Comment(**comment_content,userID=user.id,blogID=blog.b_id)
     db.add(new_comment)
+    adjust_comment_count(db,blog.b_id,1)
     db.commit()
     db.refresh(new_comment)
+    response_cache.invalidate("blogs",f"blog:{blog.b_id}")
 
     return {
         "detail" : "Comment uploaded."
     }
 
 @app.delete('/comment/{c_id}/remove',tags=['Comments'],status_code=HTTPStatus.OK)
-async def comment_remove(c_id: int,user : schemas.User = Depends(get_current_user),db: Session = Depends(get_db)):
+async def comment_remove(c_id: int,user : schemas.User = Depends(get_current_user),db: Session = Depends(get_write_db)):
     qry = db.query(models.Comment).filter(models.Comment.c_id==c_id)
     comment = qry.first()
     if comment.userID != user.id:
@@ -456,11 +603,13 @@ async def comment_remove(c_id: int,user : schemas.User = Depends(get_current_use
         )
     
     qry.delete()
+    adjust_comment_count(db,comment.blogID,-1)
     db.commit()
+    response_cache.invalidate("blogs",f"blog:{comment.blogID}")
     return{'data' : 'The requested comment has been removed.'}
 
 @app.put('/comment/{c_id}/update',tags=['Comments'],status_code=HTTPStatus.OK)
-async def comment_remove(c_id: int,comment_content : schemas.CommentBase,user : schemas.User = Depends(get_current_user),db: Session = Depends(get_db)):
+async def comment_remove(c_id: int,comment_content : schemas.CommentBase,user : schemas.User = Depends(get_current_user),db: Session = Depends(get_write_db)):
     new_comment_content = comment_content.dict(exclude_unset=True)
     qry = db.query(models.Comment).filter(models.Comment.c_id==c_id)
     comment = qry.first()
@@ -470,13 +619,15 @@ async def comment_remove(c_id: int,comment_content : schemas.CommentBase,user :
             detail="Not Authorized to perform this action.",
         )
     
+    new_comment_content["sentiment"] = analyze([new_comment_content["description"]])[0]
     qry.update(new_comment_content)
     db.commit()
     db.refresh(comment)
+    response_cache.invalidate("blogs",f"blog:{comment.blogID}")
     return{'data' : 'Comment content updated.'}
 
-@app.get('/blog/{blogID}/comment/analytics',tags=['Comments'],status_code=HTTPStatus.OK)
-async def get_analytics(blogID : int,user : schemas.User = Depends(get_current_user),db: Session = Depends(get_db)):
+@app.get('/blog/{blogID}/comment/analytics',tags=['Comments'],status_code=HTTPStatus.OK,response_model=schemas.CommentAnalytics)
+async def get_analytics(blogID : int,params : KeysetParams = Depends(),user : schemas.User = Depends(get_current_user),db: Session = Depends(get_write_db)):
     blog = db.query(models.Blog).filter(models.Blog.b_id==blogID).first()
     if blog.authorID != user.id:
         raise HTTPException(
@@ -484,17 +635,33 @@ async def get_analytics(blogID : int,user : schemas.User = Depends(get_current_u
             detail="Not Authorized to perform this action.",
         )
     
-    comments = pd.read_sql_query(sql=f"SELECT [description] FROM comments WHERE [blogID] == {blog.b_id};",con=db.connection())
-    comments = comments["description"].to_list()
-    analysis = analyze(comments)
-    valDict = {
-        1 : "positive",
-        0 : "neutral",
-        -1: "negative" 
+    # Sentiment is stored when a comment is written, only rows that predate the column are scored here
+    backfill(db, blogID=blog.b_id)
+
+    counts = dict.fromkeys(LABELS.values(), 0)
+    for sentiment, count in db.query(models.Comment.sentiment, func.count()).filter(models.Comment.blogID==blog.b_id).group_by(models.Comment.sentiment):
+        counts[LABELS[sentiment]] = count
+
+    label = case(LABELS, value=models.Comment.sentiment).label("sentiment")
+    comments = db.query(models.Comment.c_id, models.Comment.description, label).filter(models.Comment.blogID==blog.b_id)
+
+    return {
+        "counts" : counts,
+        "comments" : paginate(comments, models.Comment.c_id, params, page=KeysetPage[schemas.CommentSentiment]),
     }
-    analytics = {comments[i]: valDict[analysis[i]] for i in range(0, len(comments), 1)}
 
-    return analytics
+#------------------------------------------------------------------Search Api--------------------------------------------------------------------------------------------------------------
+@app.get('/search',tags=['Search'],status_code=HTTPStatus.OK,response_model=KeysetPage[schemas.SearchHit])
+async def search_all(q : str = Query(..., min_length=1, description="Search terms, a trailing * matches prefixes (e.g. ransom*)"),
+                     kind : List[str] = Query(list(SOURCES), description="news, blogs and / or comments"),
+                     user : schemas.User = Depends(get_current_user),db : Session = Depends(get_read_db)):
+    unknown = set(kind) - set(SOURCES)
+    if unknown:
+        raise HTTPException(
+            status_code=HTTPStatus.BAD_REQUEST,
+            detail=f"Unknown search kind {sorted(unknown)}.",
+        )
+    return search(db, q, [source for source in SOURCES if source in kind])
 
 # Adding Pagitation to app for blogs
 add_pagination(app)
\ No newline at end of file
@@ -0,0 +1,137 @@
+import json
+import logging
+import time
+from functools import lru_cache
+from contextvars import ContextVar
+from dotenv import dotenv_values
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.routing import Match
+
+credentials = dotenv_values(".env")
+
+# Prometheus metrics per route (the path template, so /blog/1 and /blog/2 share a series),
+# plus the number and duration of the SQL statements each request ran.
+# Requests slower than SLOW_REQUEST_MS are logged as one JSON line with their slowest statements.
+SLOW_REQUEST_MS = float(credentials.get('SLOW_REQUEST_MS', 500))
+SLOW_TOP_QUERIES = 5
+
+logger = logging.getLogger("csnb.slow")
+
+REQUEST_LATENCY = Histogram("http_request_duration_seconds", "Request latency", ["method", "route", "status"],
+                            buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+IN_FLIGHT = Gauge("http_requests_in_flight", "Requests being served", ["method", "route"])
+RESPONSE_SIZE = Histogram("http_response_size_bytes", "Response body size", ["method", "route"],
+                          buckets=(100, 1000, 10000, 100000, 1000000, 10000000))
+DB_QUERIES = Histogram("db_queries_per_request", "SQL statements run by a request", ["method", "route"],
+                       buckets=(0, 1, 2, 3, 5, 10, 25, 50, 100))
+DB_TIME = Histogram("db_time_per_request_seconds", "Time a request spent in SQL statements", ["method", "route"],
+                    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5))
+DB_OUTSIDE_REQUESTS = Counter("db_queries_outside_requests_total", "SQL statements run by background workers")
+
+
+class RequestStats:
+    __slots__ = ("queries", "db_time", "statements")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.statements = []
+
+# Set by the middleware for the duration of a request, visible to sync dependencies and routes run in the threadpool
+current = ContextVar("request_stats", default=None)
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _query_started(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _query_finished(conn, cursor, statement, parameters, context, executemany):
+    took = time.perf_counter() - conn.info["query_started"].pop()
+    stats = current.get()
+    if stats is None:
+        DB_OUTSIDE_REQUESTS.inc()
+        return
+    stats.queries += 1
+    stats.db_time += took
+    stats.statements.append((took, statement))
+
+@event.listens_for(Engine, "handle_error")
+def _query_failed(context):
+    if context.connection is not None and context.connection.info.get("query_started"):
+        context.connection.info["query_started"].pop()
+
+def route_of(routes, method : str, path : str):
+    # Same matching as the router, PARTIAL is a known path with another method (405)
+    scope = {"type" : "http", "method" : method, "path" : path, "root_path" : ""}
+    partial = None
+    for route in routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+        if match == Match.PARTIAL and partial is None:
+            partial = route.path
+    return partial or "unmatched"
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware, streaming responses are measured until their last chunk."""
+
+    def __init__(self, app, routes : list):
+        self.app = app
+        # Matching every route costs ~50us, paths repeat (popular blogs, list pages) so results are cached
+        self.route_of = lru_cache(maxsize=10000)(lambda method, path : route_of(routes, method, path))
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        method = scope["method"]
+        route = self.route_of(method, scope["path"])
+        stats = RequestStats()
+        token = current.set(stats)
+        response = {"status" : 500, "size" : 0}
+
+        async def send_with_metrics(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                response["size"] += len(message.get("body", b""))
+            await send(message)
+
+        in_flight = IN_FLIGHT.labels(method, route)
+        in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            took = time.perf_counter() - started
+            in_flight.dec()
+            current.reset(token)
+            REQUEST_LATENCY.labels(method, route, str(response["status"])).observe(took)
+            RESPONSE_SIZE.labels(method, route).observe(response["size"])
+            DB_QUERIES.labels(method, route).observe(stats.queries)
+            DB_TIME.labels(method, route).observe(stats.db_time)
+            if took * 1000 >= SLOW_REQUEST_MS:
+                log_slow(method, route, response["status"], took, stats)
+
+def log_slow(method : str, route : str, status : int, took : float, stats : RequestStats):
+    top = sorted(stats.statements, key=lambda statement : statement[0], reverse=True)[:SLOW_TOP_QUERIES]
+    logger.warning(json.dumps({
+        "event" : "slow_request",
+        "method" : method,
+        "route" : route,
+        "status" : status,
+        "duration_ms" : round(took * 1000, 2),
+        "queries" : stats.queries,
+        "db_ms" : round(stats.db_time * 1000, 2),
+        "top_queries" : [{"ms" : round(duration * 1000, 2), "sql" : " ".join(statement.split())[:300]} for duration, statement in top],
+    }))
+
+def gauge_from(name : str, description : str, read):
+    # Values owned by other modules (pools, caches), read at scrape time
+    Gauge(name, description).set_function(read)
+
+def render():
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,79 @@
+from datetime import datetime
+from sqlalchemy import inspect, text
+from database import add_missing_columns
+import search
+from counts import reconcile_comment_counts
+
+# Versioned, in-place schema upgrades for databases created before a model change.
+# create_all only creates missing tables, everything that alters an existing table goes here.
+# Every step is idempotent, so a fresh database created by create_all runs them as no-ops.
+
+def _create_index(conn, name : str, table : str, columns : list, unique : bool = False):
+    quoted = ", ".join(f'"{column}"' for column in columns)
+    conn.execute(text(f'CREATE {"UNIQUE " if unique else ""}INDEX IF NOT EXISTS "{name}" ON {table} ({quoted})'))
+
+def _add_sentiment(conn):
+    add_missing_columns(conn, "comments", {"sentiment" : "INTEGER"})
+
+def _add_news_dedup_key(conn):
+    add_missing_columns(conn, "news", {"dedupKey" : "VARCHAR"})
+    _create_index(conn, "ix_news_dedupKey", "news", ["dedupKey"], unique=True)
+
+def _check_unique(conn, table : str, column : str):
+    duplicates = conn.execute(text(f'SELECT "{column}", COUNT(*) FROM {table} WHERE "{column}" IS NOT NULL GROUP BY "{column}" HAVING COUNT(*) > 1')).fetchall()
+    if duplicates:
+        raise RuntimeError(f"Cannot add a unique index on {table}.{column}, duplicated values: {[row[0] for row in duplicates]}")
+
+def _add_hot_indexes(conn):
+    _check_unique(conn, "users", "username")
+    _check_unique(conn, "admin", "userID")
+    _create_index(conn, "ix_users_username", "users", ["username"], unique=True)
+    _create_index(conn, "ix_admin_userID", "admin", ["userID"], unique=True)
+    _create_index(conn, "ix_news_publishedAt", "news", ["publishedAt"])
+    _create_index(conn, "ix_blogs_authorID", "blogs", ["authorID"])
+    _create_index(conn, "ix_blogs_approved_b_id", "blogs", ["approved", "b_id"])
+    _create_index(conn, "ix_comments_blogID_c_id", "comments", ["blogID", "c_id"])
+
+def _add_search_index(conn):
+    # FTS5 is SQLite only, other engines need their own full-text index and /search answers 501 there
+    if conn.dialect.name == "sqlite":
+        search.install(conn)
+
+def _add_comment_counts(conn):
+    add_missing_columns(conn, "blogs", {"commentCount" : "INTEGER DEFAULT 0"})
+    _create_index(conn, "ix_comments_blogID_publishedAt_c_id", "comments", ["blogID", "publishedAt", "c_id"])
+    reconcile_comment_counts(conn)
+
+MIGRATIONS = [
+    (1, "comments.sentiment", _add_sentiment),
+    (2, "news.dedupKey with unique index", _add_news_dedup_key),
+    (3, "indexes on hot lookup columns", _add_hot_indexes),
+    (4, "FTS5 search index over news, blogs and comments", _add_search_index),
+    (5, "blogs.commentCount and comments by date index", _add_comment_counts),
+]
+
+def current_version(conn):
+    if "schema_version" not in inspect(conn).get_table_names():
+        conn.execute(text('CREATE TABLE schema_version (version INTEGER PRIMARY KEY, description VARCHAR, "appliedAt" DATETIME)'))
+        return 0
+    return conn.execute(text("SELECT COALESCE(MAX(version), 0) FROM schema_version")).scalar()
+
+def migrate(engine):
+    applied = []
+    with engine.begin() as conn:
+        version = current_version(conn)
+        for number, description, step in MIGRATIONS:
+            if number <= version:
+                continue
+            step(conn)
+            conn.execute(text("INSERT INTO schema_version (version, description, \"appliedAt\") VALUES (:v, :d, :t)"), {"v" : number, "d" : description, "t" : datetime.now()})
+            applied.append(number)
+    return applied
+
+if __name__ == "__main__":
+    # python migrations.py : upgrade the configured database (CSNB.db by default) in place
+    import models
+    from database import engine
+    models.Base.metadata.create_all(bind=engine)
+    applied = migrate(engine)
+    print(f"Applied migrations {applied}." if applied else "Database is up to date.")
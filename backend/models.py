@@ -1,5 +1,5 @@
 from database import Base
-from sqlalchemy import Column, ForeignKey, Integer, Boolean, String, Date, DateTime
+from sqlalchemy import Column, ForeignKey, Index, Integer, Boolean, String, Date, DateTime
 from sqlalchemy.orm import relationship,ONETOMANY,MANYTOONE
 from datetime import datetime
 from pydantic import validator
@@ -12,7 +12,7 @@ class User(Base):
     id = Column(Integer, primary_key=True)
     profilePicture = Column(String,default="UserDefault.jpg")
     fullname = Column(String)
-    username = Column(String)
+    username = Column(String, unique=True, index=True)
     description = Column(String)
     email = Column(String)
     gender = Column(String)
@@ -32,7 +32,7 @@ class Admin(Base):
 
     # fields
     id = Column(Integer, primary_key=True)
-    userID = Column(Integer,ForeignKey("users.id"))
+    userID = Column(Integer,ForeignKey("users.id"), unique=True, index=True)
     createdAt = Column(DateTime, default=datetime.now())
 
     user = relationship("User", back_populates = "admin")
@@ -50,7 +50,8 @@ class News(Base):
     urlToImage = Column(String)
     source = Column(String)
     content = Column(String)
-    publishedAt = Column(DateTime, default=datetime.now())
+    publishedAt = Column(DateTime, default=datetime.now(), index=True)
+    dedupKey = Column(String, unique=True, index=True) # sha1 of the normalized title, see ingest.dedup_key
 
 
 class Blog(Base):
@@ -58,21 +59,63 @@ class Blog(Base):
 
     # fields
     b_id = Column(Integer, primary_key=True)
-    bannner = Column(String, default="BlogDefault.png")
+    banner = Column("bannner", String, default="BlogDefault.png") # column name kept for existing databases
     title = Column(String)
     description = Column(String)
-    authorID = Column(Integer,ForeignKey("users.id"))
+    authorID = Column(Integer,ForeignKey("users.id"), index=True)
     newsID = Column(Integer,ForeignKey("news.n_id"))
     approverID = Column(Integer,ForeignKey("admin.id"))
     approved = Column(Boolean, default = False)
     likes = Column(Integer,default=0)
+    commentCount = Column(Integer,default=0,server_default="0",nullable=False) # kept by comment_upload / comment_remove, see counts.py
     publishedAt = Column(DateTime, default=datetime.now())
 
     newsItem = relationship("News", back_populates = "blogs")
     author = relationship("User", back_populates = "blogs")
     approvedBy = relationship("Admin", back_populates = "approvedblogs")
+
+    # keyset pages of approved / pending blogs
+    __table_args__ = (Index("ix_blogs_approved_b_id", "approved", "b_id"),)
     
 
+class BlogLike(Base):
+    __tablename__ = "blog_likes"
+
+    # fields
+    blogID = Column(Integer,ForeignKey("blogs.b_id"),primary_key=True)
+    userID = Column(Integer,ForeignKey("users.id"),primary_key=True)
+    createdAt = Column(DateTime, default=datetime.now())
+
+
+class StoredImage(Base):
+    __tablename__ = "images"
+
+    # fields
+    path = Column(String, primary_key=True) # <kind>/<digest>_full.<ext>, see images.py
+    refs = Column(Integer, default=0)
+    createdAt = Column(DateTime, default=datetime.now())
+
+
+class OutboxEmail(Base):
+    __tablename__ = "email_outbox"
+
+    # fields
+    id = Column(Integer, primary_key=True)
+    recipient = Column(String)
+    subject = Column(String)
+    template = Column(String) # file in templates/, rendered when the mail is sent
+    context = Column(String) # JSON template variables
+    status = Column(String, default="pending") # pending, sending (claimed by a sender until nextAttemptAt), sent or failed
+    attempts = Column(Integer, default=0)
+    nextAttemptAt = Column(DateTime)
+    lastError = Column(String)
+    createdAt = Column(DateTime, default=datetime.now())
+    sentAt = Column(DateTime)
+
+    # the sender polls for due pending mails
+    __table_args__ = (Index("ix_email_outbox_status_nextAttemptAt", "status", "nextAttemptAt"),)
+
+
 class Comment(Base):
     __tablename__ = "comments"
 
@@ -83,10 +126,17 @@ class Comment(Base):
     blogID = Column(Integer,ForeignKey("blogs.b_id"))
     publishedAt = Column(DateTime, default=datetime.now())
     likes = Column(Integer,default=0)
+    sentiment = Column(Integer) # 1 : Positive, 0 : Neutral , -1 : Negative, NULL : not scored yet
 
     blog = relationship("Blog", back_populates = "comments")
     author = relationship("User", back_populates = "comments")
 
+    # per blog comment lookups, analytics and keyset pages (by id, and by date for /blog/{b_id}/comments)
+    __table_args__ = (
+        Index("ix_comments_blogID_c_id", "blogID", "c_id"),
+        Index("ix_comments_blogID_publishedAt_c_id", "blogID", "publishedAt", "c_id"),
+    )
+
 News.blogs = relationship("Blog", order_by = Blog.b_id, back_populates = "newsItem")
 
 User.blogs = relationship("Blog", order_by = Blog.b_id, back_populates = "author")
@@ -0,0 +1,37 @@
+import json
+import os
+import sys
+from fastapi import FastAPI, Query
+from fastapi.responses import JSONResponse
+
+# Local stand-in for NewsAPI's /v2/everything serving recorded payloads, for development and tests.
+# A recorded payload is <fixtures>/<q>.json (the raw NewsAPI response), paged like the real API.
+# fixtures/technology.json is a recorded q=technology response, tests/test_newsfetch.py pages and ingests it.
+#   NEWSAPI_FIXTURES=fixtures uvicorn newsapi_stub:app --port 8001
+#   NEWSAPI_URL=http://localhost:8001/v2 in .env
+FIXTURES = os.environ.get("NEWSAPI_FIXTURES", "fixtures")
+
+app = FastAPI()
+
+@app.get("/v2/everything")
+def everything(q : str, page : int = Query(1, ge=1), pageSize : int = Query(100, ge=1, le=100)):
+    path = os.path.join(FIXTURES, f"{q}.json")
+    if not os.path.exists(path):
+        return {"status" : "ok", "totalResults" : 0, "articles" : []}
+
+    with open(path, encoding="utf-8") as f:
+        payload = json.load(f)
+    if payload.get("status") == "error":
+        return JSONResponse(payload, status_code=429 if payload.get("code") == "rateLimited" else 400)
+
+    articles = payload.get("articles", [])
+    start = (page - 1) * pageSize
+    return {
+        "status" : "ok",
+        "totalResults" : len(articles),
+        "articles" : articles[start:start + pageSize],
+    }
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, port=int(sys.argv[1]) if len(sys.argv) > 1 else 8001)
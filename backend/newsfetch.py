@@ -0,0 +1,65 @@
+import asyncio
+import httpx
+from dotenv import dotenv_values
+
+credentials = dotenv_values(".env")
+
+# Pointing NEWSAPI_URL at newsapi_stub.py serves recorded payloads instead of the real upstream
+NEWSAPI_URL = credentials.get('NEWSAPI_URL', "https://newsapi.org/v2")
+
+# Async NewsAPI client: one pooled connection set shared by every fetch, bounded concurrency,
+# upstream paging and backing off on 429 / rateLimited responses.
+class NewsClient:
+    def __init__(self, base_url : str, api_key : str, concurrency : int = 4, page_size : int = 100, max_pages : int = 1, timeout : float = 10.0, retries : int = 3):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.retries = retries
+        self.timeout = httpx.Timeout(timeout, connect=5.0)
+        self.limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout, limits=self.limits, headers={"X-Api-Key" : self.api_key or ""})
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _get(self, path : str, params : dict):
+        for attempt in range(self.retries + 1):
+            async with self._semaphore:
+                response = await self.client.get(path, params=params)
+            if response.status_code != 429 or attempt == self.retries:
+                break
+            # Sleep outside the semaphore so a throttled category does not hold a slot
+            await asyncio.sleep(float(response.headers.get("Retry-After", 2 ** attempt)))
+        response.raise_for_status()
+        return response.json()
+
+    async def fetch_category(self, category : str, since : str = None):
+        articles = []
+        for page in range(1, self.max_pages + 1):
+            params = {"q" : category, "page" : page, "pageSize" : self.page_size, "sortBy" : "publishedAt"}
+            if since:
+                params["from"] = since
+            payload = await self._get("/everything", params)
+            batch = payload.get("articles", [])
+            articles.extend(batch)
+            if len(batch) < self.page_size or len(articles) >= payload.get("totalResults", 0):
+                break
+        return articles
+
+news_client = NewsClient(
+    base_url=NEWSAPI_URL,
+    api_key=credentials.get('KEY'),
+    concurrency=int(credentials.get('NEWSAPI_CONCURRENCY', 4)),
+    page_size=int(credentials.get('NEWSAPI_PAGE_SIZE', 100)),
+    max_pages=int(credentials.get('NEWSAPI_MAX_PAGES', 1)),
+)
@@ -0,0 +1,118 @@
+import json
+from datetime import datetime
+from http import HTTPStatus
+from typing import Any, Generic, Optional, Sequence, TypeVar
+from fastapi import HTTPException, Query
+from fastapi_pagination.api import create_page, resolve_params
+from fastapi_pagination.bases import AbstractPage, AbstractParams, CursorRawParams
+from fastapi_pagination.cursor import decode_cursor, encode_cursor
+from pydantic import BaseModel
+from sqlalchemy import Table, text, tuple_
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Query as OrmQuery
+from typing_extensions import Literal
+
+T = TypeVar("T")
+
+# Keyset (seek) pagination: pages are fetched with `WHERE key > :cursor ORDER BY key LIMIT :size`
+# so only one page worth of rows is ever loaded, no matter how large the table grows.
+# The key is a unique column, or a tuple of columns ending with a unique one, e.g. (publishedAt, c_id).
+class KeysetParams(BaseModel, AbstractParams):
+    cursor : Optional[str] = Query(None, description="Opaque cursor returned as next_page by the previous page")
+    size : int = Query(50, ge=1, le=100, description="Page size")
+    total : Literal["none", "approx", "exact"] = Query("none", description="Whether to compute the total row count, approx is a statistics estimate for unfiltered lists")
+
+    def to_raw_params(self) -> CursorRawParams:
+        return CursorRawParams(cursor=decode_cursor(self.cursor), size=self.size)
+
+
+class KeysetPage(AbstractPage[T], Generic[T]):
+    items : Sequence[T]
+    total : Optional[int] = None
+    size : int
+    next_page : Optional[str] = None
+
+    __params_type__ = KeysetParams
+
+    @classmethod
+    def create(cls, items : Sequence[T], params : AbstractParams, *, total : Optional[int] = None, next_ : Optional[str] = None, **kwargs : Any):
+        return cls(
+            items=items,
+            total=total,
+            size=params.size,
+            next_page=encode_cursor(next_),
+            **kwargs,
+        )
+
+
+def _encode_key(row, keys : tuple):
+    values = [getattr(row, key.key) for key in keys]
+    if len(keys) == 1:
+        return str(values[0])
+    return json.dumps([value.isoformat() if isinstance(value, datetime) else value for value in values])
+
+def _decode_key(cursor : Optional[str], keys : tuple):
+    if not cursor:
+        return None
+    try:
+        if len(keys) == 1:
+            return int(decode_cursor(cursor))
+        values = json.loads(decode_cursor(cursor))
+        if len(values) != len(keys):
+            raise ValueError(cursor)
+        return [datetime.fromisoformat(value) if key.type.python_type is datetime else value for key, value in zip(keys, values)]
+    except (ValueError, TypeError):
+        raise HTTPException(
+            status_code=HTTPStatus.BAD_REQUEST,
+            detail="Invalid cursor.",
+        )
+
+# Row count the planner keeps for a table, None without statistics (sqlite_stat1 is written by ANALYZE)
+STATISTICS = {
+    "sqlite" : "SELECT CAST(stat AS INTEGER) FROM sqlite_stat1 WHERE tbl = :table ORDER BY idx IS NOT NULL LIMIT 1",
+    "postgresql" : "SELECT reltuples::bigint FROM pg_class WHERE relname = :table",
+    "mssql" : "SELECT SUM(row_count) FROM sys.dm_db_partition_stats WHERE object_id = OBJECT_ID(:table) AND index_id IN (0, 1)",
+}
+
+def estimated_rows(db, table : str):
+    sql = STATISTICS.get(db.get_bind().dialect.name)
+    if sql is None:
+        return None
+    try:
+        estimate = db.execute(text(sql), {"table" : table}).scalar()
+    except OperationalError:
+        # sqlite_stat1 does not exist until the first ANALYZE
+        return None
+    return estimate if estimate is not None and estimate >= 0 else None
+
+def count_rows(query : OrmQuery, mode : str):
+    # approx : the table's row estimate from planner statistics when the query is a whole, unfiltered table,
+    # filtered queries (and tables without statistics) are counted exactly. exact : COUNT(*) of the filtered query
+    if mode == "approx" and query.whereclause is None:
+        froms = query.statement.froms
+        if len(froms) == 1 and isinstance(froms[0], Table):
+            estimate = estimated_rows(query.session, froms[0].name)
+            if estimate is not None:
+                return estimate
+    if mode != "none":
+        return query.order_by(None).count()
+    return None
+
+def paginate(query : OrmQuery, key, params : Optional[KeysetParams] = None, page = None):
+    params = resolve_params(params)
+    keys = key if isinstance(key, tuple) else (key,)
+    after = _decode_key(params.cursor, keys)
+
+    total = count_rows(query, params.total)
+    if after is not None:
+        query = query.filter(keys[0] > after if len(keys) == 1 else tuple_(*keys) > tuple_(*after))
+
+    # Fetch one extra row to know whether another page exists without a second query
+    rows = query.order_by(*keys).limit(params.size + 1).all()
+    items = rows[:params.size]
+    next_ = _encode_key(items[-1], keys) if len(rows) > params.size else None
+
+    # Pages nested inside another response model are not registered by add_pagination, build them directly
+    if page is not None:
+        return page.create(items, params, total=total, next_=next_)
+    return create_page(items, total, params, next_=next_)
@@ -0,0 +1,47 @@
+import threading
+import time
+from collections import OrderedDict
+from dotenv import dotenv_values
+
+credentials = dotenv_values(".env")
+
+# In-process cache of authenticated principals keyed by the token subject (username),
+# so an authenticated request does not have to look the user and its admin row up again.
+class PrincipalCache:
+    def __init__(self, ttl : float, maxsize : int):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, subject : str):
+        with self._lock:
+            entry = self._entries.get(subject)
+            if entry is None:
+                return None
+            expires, principal = entry
+            if expires < time.monotonic():
+                del self._entries[subject]
+                return None
+            self._entries.move_to_end(subject)
+            return principal
+
+    def set(self, subject : str, principal):
+        with self._lock:
+            self._entries[subject] = (time.monotonic() + self.ttl, principal)
+            self._entries.move_to_end(subject)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, subject : str):
+        with self._lock:
+            self._entries.pop(subject, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+principals = PrincipalCache(
+    ttl=float(credentials.get('PRINCIPAL_TTL', 60)),
+    maxsize=int(credentials.get('PRINCIPAL_CACHE_SIZE', 10000)),
+)
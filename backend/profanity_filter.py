@@ -0,0 +1,169 @@
+import re
+from better_profanity.constants import ALLOWED_CHARACTERS
+from better_profanity.utils import get_complete_path_of_file, read_wordlist
+
+# Same leetspeak substitutions better_profanity checks for every word
+CHARS_MAPPING = {
+    "a": ("a", "@", "*", "4"),
+    "i": ("i", "*", "l", "1"),
+    "o": ("o", "*", "0", "@"),
+    "u": ("u", "*", "v"),
+    "v": ("v", "*", "u"),
+    "l": ("l", "1"),
+    "e": ("e", "*", "3"),
+    "s": ("s", "$", "5"),
+    "t": ("t", "7"),
+}
+
+def _char_class(chars):
+    if len(chars) == 1:
+        return re.escape(chars[0])
+    return "[" + "".join(re.escape(c) for c in sorted(set(chars))) + "]"
+
+def _trie_pattern(node):
+    # node : {char class : child node}, "" marks the end of a word
+    branches = []
+    optional = False
+    for key, child in sorted(node.items()):
+        if key == "":
+            optional = True
+            continue
+        branches.append(key + _trie_pattern(child))
+    if not branches:
+        return ""
+    pattern = branches[0] if len(branches) == 1 and not optional else "(?:" + "|".join(branches) + ")"
+    return pattern + "?" if optional else pattern
+
+def compile_wordlist(words, char_map : dict = CHARS_MAPPING):
+    """Compile every word and all of its leetspeak variants into one prefix-factored regex."""
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(_char_class(char_map.get(char, (char,))), {})
+        node[""] = {}
+    return re.compile(_trie_pattern(trie), re.DOTALL)
+
+
+class CompiledProfanity:
+    """
+    Drop-in for better_profanity.profanity.censor producing identical output.
+
+    better_profanity compares every token against each word of its list through VaryingString,
+    this class answers the same membership question with a single match of the compiled wordlist.
+    """
+
+    def __init__(self, words=None, char_map : dict = CHARS_MAPPING):
+        if words is None:
+            words = read_wordlist(get_complete_path_of_file("profanity_wordlist.txt"))
+        words = {word.lower() for word in words}
+        self.allowed = ALLOWED_CHARACTERS
+        # Longest run of separators inside a listed phrase, i.e. how many next words to combine
+        self.max_combinations = max([1] + [sum(char not in self.allowed for char in word) for word in words])
+        self._pattern = compile_wordlist(words, char_map)
+
+    def is_profane(self, word : str):
+        return self._pattern.fullmatch(word) is not None
+
+    def censor(self, text, censor_char : str = "*"):
+        if not isinstance(text, str):
+            text = str(text)
+        return self._hide_swear_words(text, str(censor_char) * 4)
+
+    def censor_many(self, texts, censor_char : str = "*"):
+        """Batch API for backfills and bulk moderation."""
+        return [self.censor(text, censor_char) for text in texts]
+
+    # The scan below mirrors better_profanity's, only the wordlist lookups differ
+
+    def _next_word_start(self, text, start):
+        for index in range(start, len(text)):
+            if text[index] in self.allowed:
+                return index
+        return len(text)
+
+    def _next_word_end(self, text, start):
+        index = start
+        for index in range(start, len(text)):
+            if text[index] not in self.allowed:
+                break
+        return text[start:index] if text[index] not in self.allowed else text[start:index + 1], index
+
+    def _next_words(self, text, start, count):
+        word_start = self._next_word_start(text, start)
+        if word_start >= len(text) - 1:
+            return [("", word_start), ("", word_start)]
+        word, end = self._next_word_end(text, word_start)
+        words = [(word, end), (text[start:word_start] + word, end)]
+        if count > 1:
+            words.extend(self._next_words(text, end, count - 1))
+        return words
+
+    def _update_next_words(self, text, words, start):
+        if not words:
+            return self._next_words(text, start, self.max_combinations)
+        del words[:2]
+        if words and words[-1][0] != "":
+            words += self._next_words(text, words[-1][1], 1)
+        return words
+
+    def _forms_swear_word(self, cur_word, words):
+        full_word = cur_word.lower()
+        full_word_with_separators = full_word
+        for index in range(0, len(words), 2):
+            single_word, end = words[index]
+            if single_word == "":
+                continue
+            full_word += single_word.lower()
+            full_word_with_separators += words[index + 1][0].lower()
+            if self.is_profane(full_word) or self.is_profane(full_word_with_separators):
+                return True, end
+        return False, -1
+
+    def _hide_swear_words(self, text, replacement):
+        censored = []
+        cur_word = ""
+        skip_index = -1
+        next_words = []
+        start = self._next_word_start(text, 0)
+
+        # No words at all, nothing to censor
+        if start >= len(text) - 1:
+            return text
+        if start > 0:
+            censored.append(text[:start])
+            text = text[start:]
+
+        allowed = self.allowed
+        for index, char in enumerate(text):
+            if index < skip_index:
+                continue
+            if char in allowed:
+                cur_word += char
+                continue
+            if cur_word.strip() == "":
+                censored.append(char)
+                cur_word = ""
+                continue
+
+            next_words = self._update_next_words(text, next_words, index)
+            found, end = self._forms_swear_word(cur_word, next_words)
+            if found:
+                cur_word = replacement
+                skip_index = end
+                char = ""
+                next_words = []
+
+            if self.is_profane(cur_word.lower()):
+                cur_word = replacement
+
+            censored.append(cur_word + char)
+            cur_word = ""
+
+        if cur_word != "" and skip_index < len(text) - 1:
+            if self.is_profane(cur_word.lower()):
+                cur_word = replacement
+            censored.append(cur_word)
+        return "".join(censored)
+
+profanity = CompiledProfanity()
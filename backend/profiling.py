@@ -0,0 +1,106 @@
+import asyncio
+import os
+import random
+import re
+from datetime import datetime
+from dotenv import dotenv_values
+
+credentials = dotenv_values(".env")
+
+# Request profiling with pyinstrument (optional dependency, only imported once a request is profiled).
+#   On demand : admins send `X-Profile: html|speedscope|store` or `?profile=...` on any request,
+#               html / speedscope return the report instead of the response, store writes it to PROFILE_DIR.
+#   Sampling  : PROFILE_SAMPLE_PERCENT of all requests are stored to PROFILE_DIR, the newest PROFILE_KEEP are kept.
+# Without a trigger and with sampling off, requests go straight through.
+PROFILE_DIR = credentials.get('PROFILE_DIR', "profiles")
+PROFILE_SAMPLE_PERCENT = float(credentials.get('PROFILE_SAMPLE_PERCENT', 0))
+PROFILE_KEEP = int(credentials.get('PROFILE_KEEP', 200))
+PROFILE_INTERVAL = float(credentials.get('PROFILE_INTERVAL', 0.001)) # seconds between samples
+
+HEADER = b"x-profile"
+QUERY = re.compile(rb"(?:^|&)profile=(\w+)")
+OUTPUTS = ("html", "speedscope", "store")
+
+def _trigger(scope):
+    for name, value in scope["headers"]:
+        if name == HEADER:
+            return value.decode()
+    match = QUERY.search(scope["query_string"])
+    return match.group(1).decode() if match else None
+
+def profile_name(method : str, path : str):
+    # Known before the request runs, so X-Profile-Stored can name the file in the response headers
+    return f"{datetime.now():%Y%m%d-%H%M%S-%f}_{method}_{re.sub(r'[^A-Za-z0-9]+', '-', path).strip('-') or 'root'}.speedscope.json"
+
+def store(profiler, name : str, directory : str = PROFILE_DIR, keep : int = PROFILE_KEEP):
+    # speedscope JSON opens as a flame graph on speedscope.app (with the request's duration), files are rotated oldest first
+    from pyinstrument.renderers import SpeedscopeRenderer
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, name), "w") as file:
+        file.write(profiler.output(SpeedscopeRenderer()))
+    profiles = sorted(entry for entry in os.listdir(directory) if entry.endswith(".speedscope.json"))
+    for old in profiles[:-keep] if keep > 0 else []:
+        os.remove(os.path.join(directory, old))
+    return name
+
+
+class ProfilingMiddleware:
+    """
+    authorize : async callable receiving the ASGI scope, True when the request comes from an admin.
+    Only consulted for requests carrying a trigger, so regular traffic never pays for the lookup.
+    """
+
+    def __init__(self, app, authorize, sample_percent : float = PROFILE_SAMPLE_PERCENT):
+        self.app = app
+        self.authorize = authorize
+        self.sample_percent = sample_percent
+        self.active = False # pyinstrument runs one profiler per thread, overlapping requests are not profiled
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        trigger = _trigger(scope)
+        if trigger is None:
+            if self.sample_percent <= 0 or self.active or random.random() * 100 >= self.sample_percent:
+                return await self.app(scope, receive, send)
+            output = "store"
+        elif trigger not in OUTPUTS or self.active or not await self.authorize(scope):
+            # Unknown outputs and non admins are served as if there was no trigger
+            return await self.app(scope, receive, send)
+        else:
+            output = trigger
+
+        from pyinstrument import Profiler
+        profiler = Profiler(interval=PROFILE_INTERVAL, async_mode="enabled")
+        name = profile_name(scope["method"], scope["path"])
+
+        async def send_or_drop(message):
+            # On demand reports replace the response, the profiled one is discarded
+            if output != "store":
+                return
+            if message["type"] == "http.response.start" and trigger is not None:
+                # Where an on demand profile is written : <PROFILE_DIR>/<name>
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-stored", name.encode())]
+            await send(message)
+
+        self.active = True
+        try:
+            profiler.start()
+            try:
+                await self.app(scope, receive, send_or_drop)
+            finally:
+                profiler.stop()
+        finally:
+            self.active = False
+
+        if output == "store":
+            await asyncio.to_thread(store, profiler, name)
+            return
+        if output == "html":
+            body, content_type = profiler.output_html().encode(), b"text/html; charset=utf-8"
+        else:
+            from pyinstrument.renderers import SpeedscopeRenderer
+            body, content_type = profiler.output(SpeedscopeRenderer()).encode(), b"application/json"
+        await send({"type" : "http.response.start", "status" : 200, "headers" : [(b"content-type", content_type), (b"content-length", str(len(body)).encode())]})
+        await send({"type" : "http.response.body", "body" : body})
@@ -0,0 +1,67 @@
+import re
+import sys
+from sqlalchemy import and_, case, func, tuple_
+import models
+from analytics import LABELS
+from database import SessionLocal, engine
+from loaders import blog_summaries
+
+# python query_plans.py : EXPLAIN QUERY PLAN for the queries behind each route, flags full table scans.
+# Exits with 1 when a scan is found, so it can gate schema changes in CI.
+
+FULL_SCAN = re.compile(r"\bSCAN (?:TABLE )?(\w+)\b(?! USING (?:COVERING )?INDEX)(?! USING INTEGER PRIMARY KEY)")
+
+def route_queries(db):
+    User, Admin, News, Blog, Comment, BlogLike = models.User, models.Admin, models.News, models.Blog, models.Comment, models.BlogLike
+    return [
+        ("get_current_user", db.query(User, Admin.id).outerjoin(Admin, Admin.userID==User.id).filter(User.username=="someone")),
+        ("register", db.query(User).filter(User.username=="someone")),
+        ("update_user", db.query(User).filter(User.id!=1).filter(User.username=="someone")),
+        ("filteredUsers", db.query(User).filter(User.gender=="male", User.id > 0).order_by(User.id).limit(51)),
+        ("ingest_articles", db.query(News.dedupKey).filter(News.dedupKey.in_(["a", "b"]))),
+        ("get_top_headline", db.query(News).order_by(News.publishedAt).limit(1)),
+        ("get_news", db.query(News.n_id, News.title).filter(News.n_id > 0).order_by(News.n_id).limit(51)),
+        ("get_news_item", db.query(News).filter(News.n_id==1)),
+        ("get_blogs", blog_summaries(db).filter(Blog.approved==True, Blog.b_id > 0).order_by(Blog.b_id).limit(51)),
+        ("filteredBlogs", blog_summaries(db).filter(Blog.approved==False, Blog.b_id > 0).order_by(Blog.b_id).limit(51)),
+        ("get_blog", db.query(Blog).filter(Blog.b_id==1)),
+        ("get_comments", db.query(Comment).filter(Comment.blogID==1, tuple_(Comment.publishedAt, Comment.c_id) > tuple_("2024-01-01", 1)).order_by(Comment.publishedAt, Comment.c_id).limit(51)),
+        ("blog author", db.query(User).filter(User.id.in_([1, 2]))),
+        ("likeBlog", db.query(Blog.b_id, BlogLike.userID).outerjoin(BlogLike, and_(BlogLike.blogID==Blog.b_id, BlogLike.userID==1)).filter(Blog.b_id==1)),
+        ("get_analytics counts", db.query(Comment.sentiment, func.count()).filter(Comment.blogID==1).group_by(Comment.sentiment)),
+        ("get_analytics page", db.query(Comment.c_id, Comment.description, case(LABELS, value=Comment.sentiment)).filter(Comment.blogID==1, Comment.c_id > 0).order_by(Comment.c_id).limit(51)),
+        ("get_analytics backfill", db.query(Comment.c_id, Comment.description).filter(Comment.sentiment == None, Comment.c_id > 0, Comment.blogID==1).order_by(Comment.c_id).limit(500)),
+        ("comment_remove", db.query(Comment).filter(Comment.c_id==1)),
+        ("mail_sender due", db.query(models.OutboxEmail.id).filter(models.OutboxEmail.status.in_(("pending", "sending")), models.OutboxEmail.nextAttemptAt <= "2024-01-01").order_by(models.OutboxEmail.nextAttemptAt).limit(50)),
+    ]
+
+def compile_sql(query):
+    return str(query.statement.compile(dialect=engine.dialect, compile_kwargs={"literal_binds" : True}))
+
+def explain(db, query):
+    return [row[-1] for row in db.connection().exec_driver_sql("EXPLAIN QUERY PLAN " + compile_sql(query))]
+
+def check(db, allow : tuple = ()):
+    # allow : routes whose scans are accepted, e.g. filteredUsers filters on the unindexed gender
+    flagged = []
+    for route, query in route_queries(db):
+        plan = explain(db, query)
+        scans = [line for line in plan if FULL_SCAN.search(line)]
+        status = "ok" if not scans else ("allowed" if route in allow else "FULL SCAN")
+        print(f"{status:>10}  {route}")
+        for line in plan:
+            print(f"{'':>12}{line}")
+        if scans and route not in allow:
+            flagged.append(route)
+    return flagged
+
+if __name__ == "__main__":
+    if engine.dialect.name != "sqlite":
+        sys.exit("query_plans.py runs EXPLAIN QUERY PLAN, point SQLALCHEMY_DATABASE_URL at a SQLite database.")
+    db = SessionLocal()
+    try:
+        flagged = check(db, allow=tuple(sys.argv[1:]))
+    finally:
+        db.close()
+    print(f"\n{len(flagged)} route(s) with full scans: {flagged}" if flagged else "\nNo full table scans.")
+    sys.exit(1 if flagged else 0)
@@ -0,0 +1,124 @@
+import asyncio
+import random
+import time
+from datetime import datetime
+from dotenv import dotenv_values
+from cache import response_cache
+from database import SessionLocal
+from ingest import ingest_articles, parse_published
+from newsfetch import news_client
+
+credentials = dotenv_values(".env")
+
+# Background news ingestion: refreshes the configured categories every interval (with jitter),
+# backs off categories whose fetch keeps failing and serves refreshes queued by fetch_News.
+# `workers` categories are refreshed at once, the client's own limit caps the requests they make upstream.
+class NewsScheduler:
+    def __init__(self, client, categories : list, interval : float, jitter : float = 0.1, max_backoff : float = 3600, workers : int = 4):
+        self.client = client
+        self.categories = categories
+        self.interval = interval
+        self.jitter = jitter
+        self.max_backoff = max_backoff
+        self.workers = max(workers, 1)
+        self.high_water = {}
+        self.stats = {}
+        self._failures = {}
+        self._retry_at = {}
+        self._pending = set()
+        self._running = set()
+        # Exists before start, so fetch_News can queue a refresh without the startup event having run
+        self._queue = asyncio.Queue()
+        self._tasks = []
+
+    def enqueue(self, category : str):
+        # A category waiting in the queue or being refreshed is not queued again
+        if category not in self._pending and category not in self._running:
+            self._pending.add(category)
+            self._queue.put_nowait(category)
+
+    async def start(self):
+        # Categories queued before start are carried over to a queue of the running loop
+        queued, self._queue = self._queue, asyncio.Queue()
+        while not queued.empty():
+            self._queue.put_nowait(queued.get_nowait())
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        if self.categories and self.interval > 0:
+            self._tasks.append(asyncio.create_task(self._periodic()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _periodic(self):
+        while True:
+            now = time.monotonic()
+            for category in self.categories:
+                if self._retry_at.get(category, 0) <= now:
+                    self.enqueue(category)
+            await asyncio.sleep(self.interval * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+    async def _worker(self):
+        while True:
+            category = await self._queue.get()
+            self._pending.discard(category)
+            self._running.add(category)
+            try:
+                await self.refresh(category)
+            except Exception:
+                # Already recorded in stats, keep serving the other categories
+                pass
+            finally:
+                self._running.discard(category)
+
+    def _ingest(self, articles : list):
+        db = SessionLocal()
+        try:
+            return ingest_articles(db, articles)
+        finally:
+            db.close()
+
+    async def refresh(self, category : str):
+        started = time.monotonic()
+        stats = self.stats.setdefault(category, {})
+        stats["last_run"] = datetime.now()
+        since = self.high_water.get(category)
+        try:
+            articles = await self.client.fetch_category(category, since=since.isoformat() if since else None)
+            # Only articles newer than the high-water mark are ingested, `from` is day granular upstream
+            published = [(parse_published(article.get("publishedAt")), article) for article in articles]
+            fresh = [article for at, article in published if since is None or (at is not None and at > since)]
+            counts = await asyncio.to_thread(self._ingest, fresh) if fresh else {"inserted" : 0, "skipped" : 0}
+        except Exception as e:
+            failures = self._failures[category] = self._failures.get(category, 0) + 1
+            self._retry_at[category] = time.monotonic() + min(self.interval * 2 ** failures, self.max_backoff)
+            stats.update(duration=time.monotonic() - started, error=str(e), failures=failures)
+            raise
+
+        if counts["inserted"]:
+            response_cache.invalidate("news")
+        marks = [at for at, _ in published if at is not None]
+        if marks:
+            self.high_water[category] = max(marks + ([since] if since else []))
+        self._failures.pop(category, None)
+        self._retry_at.pop(category, None)
+        stats.update(
+            duration=time.monotonic() - started,
+            fetched=len(articles),
+            inserted=counts["inserted"],
+            skipped=len(articles) - counts["inserted"],
+            high_water=self.high_water.get(category),
+            error=None,
+            failures=0,
+        )
+        return counts
+
+scheduler = NewsScheduler(
+    news_client,
+    categories=[category.strip() for category in credentials.get('NEWS_CATEGORIES', "").split(",") if category.strip()],
+    interval=float(credentials.get('NEWS_INTERVAL', 900)),
+    jitter=float(credentials.get('NEWS_JITTER', 0.1)),
+    workers=int(credentials.get('NEWSAPI_CONCURRENCY', 4)),
+)
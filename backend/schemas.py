@@ -1,6 +1,7 @@
 from datetime import datetime
 from pydantic import BaseModel
-from typing import List
+from typing import Dict, List
+from pagination import KeysetPage
 
 # User Pydantic models
 class UserBase(BaseModel):
@@ -20,6 +21,10 @@ class User(UserBase):
     class Config:
         orm_mode = True
 
+# Authenticated user as cached by get_current_user, adminID is None for non admins
+class Principal(User):
+    adminID : int | None = None
+
 # News Pydantic models
 class News(BaseModel):
     n_id: int
@@ -35,6 +40,19 @@ class News(BaseModel):
     class Config:
         orm_mode = True
 
+# Lean list item, selected column by column (see loaders.summary_query)
+class NewsSummary(BaseModel):
+    n_id: int
+    author : str | None
+    title : str
+    source : str
+    url : str
+    urlToImage : str | None
+    publishedAt : datetime
+
+    class Config:
+        orm_mode = True
+
 # Comment Pydantic models
 class CommentBase(BaseModel):
     description: str
@@ -47,6 +65,26 @@ class Comment(CommentBase):
     class Config:
         orm_mode = True
 
+class CommentSentiment(BaseModel):
+    c_id: int
+    description : str
+    sentiment : str | None
+
+    class Config:
+        orm_mode = True
+
+class CommentAnalytics(BaseModel):
+    counts : Dict[str, int]
+    comments : KeysetPage[CommentSentiment]
+
+# Search Pydantic models
+class SearchHit(BaseModel):
+    kind : str # news, blogs or comments
+    id : int
+    rank : float # bm25, lower is a better match
+    title : str | None # highlighted title, None for comments
+    snippet : str
+
 # Blog Pydantic models
 class BlogBase(BaseModel):
     title : str
@@ -57,13 +95,30 @@ class Blog(BlogBase):
     approved : bool
     banner : str | None
     newsItem : News
-    comments : List[Comment]
+    commentCount : int | None # comments are paged by /blog/{b_id}/comments
     author : User
     publishedAt : datetime
     
     class Config:
         orm_mode = True
 
+# Lean list item, the full blog with news, comments and author stays on /blog/{b_id}
+class BlogSummary(BaseModel):
+    b_id: int
+    title : str
+    banner : str | None
+    approved : bool
+    likes : int | None
+    commentCount : int
+    authorID : int | None
+    authorName : str | None
+    newsID : int | None
+    newsTitle : str | None
+    publishedAt : datetime
+
+    class Config:
+        orm_mode = True
+
 # Admin Pydantic model
 class Admin(BaseModel):
     id: int
@@ -0,0 +1,101 @@
+import re
+from http import HTTPStatus
+from typing import Optional
+from fastapi import HTTPException
+from fastapi_pagination.api import create_page, resolve_params
+from fastapi_pagination.cursor import decode_cursor
+from sqlalchemy import text
+from pagination import KeysetParams
+
+# Full-text search over news, approved blogs and their comments.
+# Each source table has an external content FTS5 index (the text is not stored twice), kept in sync by triggers,
+# with prefix indexes so `term*` queries don't scan the whole term list.
+
+SOURCES = {
+    # kind : (code, table, key, indexed columns, bm25 column weights)
+    "news" : (0, "news", "n_id", ["title", "description", "content"], [10.0, 4.0, 1.0]),
+    "blogs" : (1, "blogs", "b_id", ["title", "description"], [10.0, 1.0]),
+    "comments" : (2, "comments", "c_id", ["description"], [1.0]),
+}
+KINDS = {code : kind for kind, (code, *_) in SOURCES.items()}
+
+SNIPPET_TOKENS = 16
+
+def install(conn):
+    """Create the FTS5 tables and triggers, then index the rows that already exist (see migrations.py)."""
+    for kind, (code, table, key, columns, weights) in SOURCES.items():
+        fts = f"{table}_fts"
+        quoted = ", ".join(f'"{column}"' for column in columns)
+        new = ", ".join(f'new."{column}"' for column in columns)
+        old = ", ".join(f'old."{column}"' for column in columns)
+        conn.execute(text(f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({quoted}, content='{table}', content_rowid='{key}', tokenize='porter unicode61 remove_diacritics 2', prefix='2 3 4')"))
+        conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN INSERT INTO {fts}(rowid, {quoted}) VALUES (new.{key}, {new}); END"))
+        conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN INSERT INTO {fts}({fts}, rowid, {quoted}) VALUES ('delete', old.{key}, {old}); END"))
+        # Only edits to indexed columns reindex a row, e.g. like counter updates don't
+        conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {quoted} ON {table} BEGIN "
+                          f"INSERT INTO {fts}({fts}, rowid, {quoted}) VALUES ('delete', old.{key}, {old}); "
+                          f"INSERT INTO {fts}(rowid, {quoted}) VALUES (new.{key}, {new}); END"))
+        conn.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
+
+def fts_query(q : str):
+    # User input is reduced to quoted terms (implicit AND) so FTS5 syntax can't be injected, a trailing * keeps a prefix query
+    terms = re.findall(r"\w+\*?", q)
+    if not terms:
+        raise HTTPException(
+            status_code=HTTPStatus.BAD_REQUEST,
+            detail="Empty search query.",
+        )
+    return " ".join(f'"{term.rstrip("*")}"' + ("*" if term.endswith("*") else "") for term in terms)
+
+def _select(kind : str):
+    code, table, key, columns, weights = SOURCES[kind]
+    fts = f"{table}_fts"
+    rank = f"bm25({fts}, {', '.join(map(str, weights))})"
+    title = f"highlight({fts}, 0, '<mark>', '</mark>')" if kind != "comments" else "NULL"
+    snippet = f"snippet({fts}, -1, '<mark>', '</mark>', '…', {SNIPPET_TOKENS})"
+    # Only approved blogs, and comments on them, are searchable
+    joins = {
+        "news" : "",
+        "blogs" : f"JOIN blogs b ON b.b_id = {fts}.rowid AND b.approved = 1",
+        "comments" : f"JOIN comments c ON c.c_id = {fts}.rowid JOIN blogs b ON b.b_id = c.\"blogID\" AND b.approved = 1",
+    }[kind]
+    return f"SELECT {code} AS kind, {fts}.rowid AS id, {rank} AS rank, {title} AS title, {snippet} AS snippet FROM {fts} {joins} WHERE {fts} MATCH :q"
+
+def _decode_position(cursor : Optional[str]):
+    if not cursor:
+        return None
+    try:
+        rank, kind, id = decode_cursor(cursor).split(":")
+        return float(rank), int(kind), int(id)
+    except ValueError:
+        raise HTTPException(
+            status_code=HTTPStatus.BAD_REQUEST,
+            detail="Invalid cursor.",
+        )
+
+def search(db, q : str, kinds : list, params : Optional[KeysetParams] = None):
+    if db.get_bind().dialect.name != "sqlite":
+        raise HTTPException(
+            status_code=HTTPStatus.NOT_IMPLEMENTED,
+            detail="Search needs the SQLite FTS5 index.",
+        )
+    params = resolve_params(params)
+    after = _decode_position(params.cursor)
+    hits = " UNION ALL ".join(_select(kind) for kind in kinds)
+    values = {"q" : fts_query(q), "limit" : params.size + 1}
+
+    total = None
+    if params.total != "none":
+        total = db.execute(text(f"SELECT COUNT(*) FROM ({hits})"), values).scalar()
+
+    # Keyset on (rank, kind, id): bm25 is deterministic for a given index, kind and id break ties
+    seek = ""
+    if after is not None:
+        seek = "WHERE (rank, kind, id) > (:rank, :kind, :id)"
+        values.update(rank=after[0], kind=after[1], id=after[2])
+    rows = db.execute(text(f"SELECT * FROM ({hits}) {seek} ORDER BY rank, kind, id LIMIT :limit"), values).fetchall()
+
+    items = [dict(kind=KINDS[row.kind], id=row.id, rank=row.rank, title=row.title, snippet=row.snippet) for row in rows[:params.size]]
+    last = rows[params.size - 1] if len(rows) > params.size else None
+    next_ = f"{last.rank!r}:{last.kind}:{last.id}" if last else None
+    return create_page(items, total, params, next_=next_)
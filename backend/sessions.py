@@ -0,0 +1,69 @@
+import threading
+import time
+from dotenv import dotenv_values
+from fastapi import Request
+from sqlalchemy import event
+from authentication import token_subject
+from database import ReadSessionLocal, SessionLocal
+
+credentials = dotenv_values(".env")
+
+# After a user writes, its reads stay on the primary for STICKY_SECONDS so replicas lagging
+# behind can't hide its own writes (e.g. update_user followed by login), whichever token it uses.
+# Principals are always cached from the primary, see main.load_principal.
+STICKY_SECONDS = float(credentials.get('STICKY_SECONDS', 5))
+
+class StickyWrites:
+    def __init__(self, seconds : float, maxsize : int = 100000):
+        self.seconds = seconds
+        self.maxsize = maxsize
+        self._until = {}
+        self._lock = threading.Lock()
+
+    def mark(self, key : str):
+        if not key or self.seconds <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if len(self._until) >= self.maxsize:
+                self._until = {k : until for k, until in self._until.items() if until > now}
+            self._until[key] = now + self.seconds
+
+    def is_sticky(self, key : str):
+        if not key:
+            return False
+        with self._lock:
+            until = self._until.get(key)
+            if until is None:
+                return False
+            if until < time.monotonic():
+                del self._until[key]
+                return False
+            return True
+
+sticky = StickyWrites(STICKY_SECONDS)
+
+def _subject(request : Request):
+    # The token subject (username) identifies the client across its requests and tokens
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    return token_subject(token) if scheme.lower() == "bearer" else None
+
+# Mutating routes : primary database
+def get_write_db(request : Request):
+    db = SessionLocal()
+    subject = _subject(request)
+    if subject:
+        # Marked when the transaction commits, before the response is sent
+        event.listen(db, "after_commit", lambda session : sticky.mark(subject))
+    try:
+        yield db
+    finally:
+        db.close()
+
+# Read only routes : a read engine, or the primary while the client's own writes may not have replicated
+def get_read_db(request : Request):
+    db = SessionLocal() if sticky.is_sticky(_subject(request)) else ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
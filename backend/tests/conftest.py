@@ -0,0 +1,38 @@
+import os
+import socket
+import sys
+import tempfile
+
+# Modules read .env, the database and relative paths (templates) from the working directory when imported,
+# so tests run from a scratch directory with their own .env and database. CSNB.db is never touched.
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+WORKDIR = tempfile.mkdtemp(prefix="csnb-tests-")
+SMTP_PORT = free_port()
+MAIL_MAX_ATTEMPTS = 3
+
+os.symlink(os.path.join(BACKEND, "templates"), os.path.join(WORKDIR, "templates"))
+os.makedirs(os.path.join(WORKDIR, "static"))
+with open(os.path.join(WORKDIR, ".env"), "w") as env:
+    env.write("\n".join([
+        "SECRET=test-secret",
+        "Algorithm=HS256",
+        "EMAIL=noreply@csnb.in",
+        f"DATABASE_URL=sqlite:///{os.path.join(WORKDIR, 'test.db')}",
+        f"STATIC_DIR={os.path.join(WORKDIR, 'static')}",
+        "BCRYPT_ROUNDS=4",
+        "SMTP_HOST=127.0.0.1",
+        f"SMTP_PORT={SMTP_PORT}",
+        "SMTP_SECURITY=none",
+        "SMTP_AUTH=0",
+        "MAIL_POLL=0.05",
+        "MAIL_RETRY_SECONDS=0",
+        f"MAIL_MAX_ATTEMPTS={MAIL_MAX_ATTEMPTS}",
+    ]) + "\n")
+os.chdir(WORKDIR)
@@ -0,0 +1,53 @@
+import pytest
+from sqlalchemy import event
+from sqlalchemy.orm import sessionmaker
+import models
+import schemas
+from database import sqlite_engine
+from loaders import blog_summaries, query_for
+from pagination import KeysetPage, KeysetParams, paginate
+
+# Serializing a response must take the same number of queries however many related rows there are,
+# a lazy load per comment or author would make the count grow with N.
+
+def seeded(path, n : int):
+    engine = sqlite_engine(f"sqlite:///{path}")
+    models.Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    db.add_all([models.User(id=i, username=f"user{i}", fullname=f"User {i}", email="e", gender="other") for i in range(1, n + 1)])
+    db.add_all([models.News(n_id=i, title=f"news {i}", description="d", content="c", source="s", url="u") for i in range(1, n + 1)])
+    db.add_all([models.Blog(b_id=i, title=f"blog {i}", description="d", authorID=i, newsID=i, approved=True, likes=0, commentCount=n) for i in range(1, n + 1)])
+    # Every blog is commented by every user
+    db.add_all([models.Comment(description="c", userID=u, blogID=b, likes=0) for b in range(1, n + 1) for u in range(1, n + 1)])
+    db.commit()
+    db.close()
+    return engine
+
+def count_queries(engine, serialize):
+    statements = []
+    listener = lambda conn, cursor, statement, *args : statements.append(statement)
+    event.listen(engine, "before_cursor_execute", listener)
+    db = sessionmaker(bind=engine)()
+    try:
+        serialize(db)
+    finally:
+        db.close()
+        event.remove(engine, "before_cursor_execute", listener)
+    return len(statements)
+
+def blog(db):
+    return schemas.Blog.from_orm(query_for(db, models.Blog, schemas.Blog).filter(models.Blog.b_id==1).first()).json()
+
+def comments_page(db):
+    query = query_for(db, models.Comment, schemas.Comment).filter(models.Comment.blogID==1)
+    return paginate(query, (models.Comment.publishedAt, models.Comment.c_id), KeysetParams(cursor=None, size=50, total="none"), page=KeysetPage[schemas.Comment]).json()
+
+def blogs_page(db):
+    return paginate(blog_summaries(db), models.Blog.b_id, KeysetParams(cursor=None, size=50, total="none"), page=KeysetPage[schemas.BlogSummary]).json()
+
+@pytest.mark.parametrize("serialize, bound", [(blog, 1), (comments_page, 1), (blogs_page, 1)])
+def test_query_count_does_not_grow_with_rows(tmp_path, serialize, bound):
+    small = count_queries(seeded(tmp_path / "small.db", 3), serialize)
+    large = count_queries(seeded(tmp_path / "large.db", 30), serialize)
+    assert small == large
+    assert large <= bound
@@ -0,0 +1,101 @@
+import asyncio
+import time
+import pytest
+from aiosmtpd.controller import Controller
+from fastapi.testclient import TestClient
+from conftest import MAIL_MAX_ATTEMPTS, SMTP_PORT
+import main
+import models
+from database import SessionLocal
+from mailer import MailSender
+
+# The outbox is delivered to a local aiosmtpd sink. The app's own mail_sender is not started
+# (TestClient without a with block), each test drives its own MailSender.
+
+class Sink:
+    def __init__(self, refuse : int = 0):
+        self.refuse = refuse # the first `refuse` deliveries get a temporary 451 reply
+        self.attempts = 0
+        self.messages = []
+
+    async def handle_DATA(self, server, session, envelope):
+        self.attempts += 1
+        if self.attempts <= self.refuse:
+            return "451 Temporary failure, try again later"
+        self.messages.append(envelope)
+        return "250 OK"
+
+@pytest.fixture
+def sink(request):
+    handler = Sink(getattr(request, "param", 0))
+    controller = Controller(handler, hostname="127.0.0.1", port=SMTP_PORT)
+    controller.start()
+    yield handler
+    controller.stop()
+
+@pytest.fixture
+def client():
+    db = SessionLocal()
+    db.query(models.OutboxEmail).delete()
+    db.query(models.User).delete()
+    db.commit()
+    db.close()
+    return TestClient(main.app)
+
+def register(client, username : str):
+    response = client.post("/user/register", json={"fullname" : "Test User", "username" : username, "description" : "d",
+                                                    "email" : f"{username}@example.com", "gender" : "other", "password" : "secret"})
+    assert response.status_code == 201, response.text
+
+def outbox():
+    db = SessionLocal()
+    try:
+        return db.query(models.OutboxEmail.recipient, models.OutboxEmail.status, models.OutboxEmail.attempts).all()
+    finally:
+        db.close()
+
+def deliver(until, senders : int = 1, timeout : float = 10):
+    # Runs MailSenders until every outbox row satisfies `until`
+    async def run():
+        workers = [MailSender(connections=2, batch=10, poll=0.05, max_attempts=MAIL_MAX_ATTEMPTS, retry_base=0) for _ in range(senders)]
+        for worker in workers:
+            await worker.start()
+        deadline = time.monotonic() + timeout
+        try:
+            while not all(until(row) for row in await asyncio.to_thread(outbox)):
+                assert time.monotonic() < deadline, outbox()
+                await asyncio.sleep(0.05)
+        finally:
+            for worker in workers:
+                await worker.stop()
+        return workers
+    return asyncio.run(run())
+
+def test_verification_mail_is_delivered(sink, client):
+    register(client, "alice")
+    deliver(lambda row : row.status == "sent")
+    assert [envelope.rcpt_tos for envelope in sink.messages] == [["alice@example.com"]]
+    assert b"CSNB Account Verification" in sink.messages[0].content
+    assert outbox()[0].attempts == 1
+
+def test_concurrent_senders_send_each_mail_once(sink, client):
+    for i in range(20):
+        register(client, f"user{i}")
+    workers = deliver(lambda row : row.status == "sent", senders=3)
+    assert sorted(envelope.rcpt_tos[0] for envelope in sink.messages) == sorted(f"user{i}@example.com" for i in range(20))
+    assert sum(worker.sent for worker in workers) == 20
+
+@pytest.mark.parametrize("sink", [2], indirect=True)
+def test_temporary_failure_is_retried(sink, client):
+    register(client, "bob")
+    deliver(lambda row : row.status == "sent")
+    assert len(sink.messages) == 1
+    assert outbox()[0].attempts == 3
+
+@pytest.mark.parametrize("sink", [100], indirect=True)
+def test_mail_fails_after_max_attempts(sink, client):
+    register(client, "carol")
+    deliver(lambda row : row.status == "failed")
+    assert sink.messages == []
+    assert outbox()[0].attempts == MAIL_MAX_ATTEMPTS
+    assert sink.attempts == MAIL_MAX_ATTEMPTS
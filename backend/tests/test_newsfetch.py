@@ -0,0 +1,55 @@
+import asyncio
+import os
+import httpx
+import pytest
+from sqlalchemy.orm import sessionmaker
+import models
+import newsapi_stub
+from conftest import BACKEND
+from database import sqlite_engine
+from ingest import ingest_articles
+from newsfetch import NewsClient
+
+# NewsClient against newsapi_stub serving the recorded fixtures/technology.json: five articles,
+# the last one a syndicated copy of the first (same title up to case and whitespace).
+
+@pytest.fixture(autouse=True)
+def fixtures(monkeypatch):
+    monkeypatch.setattr(newsapi_stub, "FIXTURES", os.path.join(BACKEND, "fixtures"))
+
+def fetch(category : str, page_size : int, max_pages : int):
+    async def run():
+        news = NewsClient("http://stub/v2", api_key="test", page_size=page_size, max_pages=max_pages)
+        requests = []
+        async def record(request):
+            requests.append(request.url.params["page"])
+        news._client = httpx.AsyncClient(transport=httpx.ASGITransport(app=newsapi_stub.app), base_url=news.base_url,
+                                         event_hooks={"request" : [record]})
+        try:
+            return await news.fetch_category(category), requests
+        finally:
+            await news.close()
+    return asyncio.run(run())
+
+@pytest.mark.parametrize("page_size, max_pages, pages, fetched", [(2, 5, ["1", "2", "3"], 5), (2, 2, ["1", "2"], 4), (100, 1, ["1"], 5)])
+def test_fetch_category_pages(page_size, max_pages, pages, fetched):
+    articles, requests = fetch("technology", page_size, max_pages)
+    assert requests == pages
+    assert len(articles) == fetched
+
+def test_unknown_category_is_empty():
+    assert fetch("gardening", 2, 5) == ([], ["1"])
+
+def test_ingest_counts(tmp_path):
+    engine = sqlite_engine(f"sqlite:///{tmp_path / 'news.db'}")
+    models.Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    articles, _ = fetch("technology", 2, 5)
+    try:
+        assert ingest_articles(db, articles) == {"inserted" : 4, "skipped" : 1}
+        # A second refresh of the same category inserts nothing
+        assert ingest_articles(db, articles) == {"inserted" : 0, "skipped" : 5}
+        assert db.query(models.News).count() == 4
+        assert db.query(models.News.source).filter(models.News.url=="https://example.com/tech/chip-capacity").scalar() == "Reuters"
+    finally:
+        db.close()